@@ -12,7 +12,7 @@ Input
 # Built-in
 import os
 # Additional
-from numpy import uint16, int8, int16, float32, float64, isnan, load
+from numpy import uint16, int8, int16, float32, float64, isnan
 #Own
 from pysenorge.set_environment import UintFillValue, IntFillValue, FloatFillValue, pysenorgedir #@UnresolvedImport
 
@@ -108,8 +108,8 @@ def nan2fill(A, FillValue=None):
 
 def set_mask(A):
     FillValue = get_FillValue(A.dtype)
-    mask = load(os.path.join(pysenorgedir,"resources/norway_mask.npy"))
-    A[mask] = FillValue
+    from pysenorge.grid import land_mask
+    land_mask().fill(A, FillValue)
     return A
         
         
@@ -6,56 +6,254 @@ UNDER CONSTRUCTION
 '''
 # Built-in
 import os, sys
+import tempfile
+import hashlib
 
 sys.path.append(os.path.abspath('..'))
 # Additional
 import numpy as np
 import numpy.ma as ma
-from numpy import arange, meshgrid, ones, where, load, nan
+from numpy import arange, meshgrid, ones, where, load, save, nan
 
 # Own
 from pysenorge.set_environment import pysenorgedir
 
+# seNorge grid definition: lower left and upper right corner and interval in m
+LowerLeftEast = -75000
+LowerLeftNorth = 6450000
+UpperRightEast = 1120000
+UpperRightNorth = 8000000
+dx = 1000
+dy = 1000
+senorge_proj4 = '+proj=utm +zone=33 +ellps=WGS84 +datum=WGS84 +units=m +no_defs'
+
+# Geometry of the meshed grid, filled on first use by senorge_geometry()
+_geometry = {}
+
+# Folder of the saved regridding weights, see Regridder. The package folder
+# may be read-only and only holds shipped data. None disables saving.
+regrid_cachedir = os.path.join(os.path.expanduser('~'), '.pysenorge', 'regrid')
+
 def senorge_grid(meshed=False):
-    from pyproj import Proj
     '''
     Creates the seNorge grid.
     
     @param meshed: Flag
     
     @return: x, y 1-D arrays containing the UTM zone 33 coordinates of the senorge grid.
-        If I{meshed=True} a x, y meshgrid is returned.
+        If I{meshed=True} a x, y meshgrid and the lon, lat grids are returned
+        (read-only, see L{senorge_geometry}).
     '''
-    # lower left corner in m
-    LowerLeftEast = -75000
-    LowerLeftNorth = 6450000
-    # upper right corner in m
-    UpperRightEast = 1120000
-    UpperRightNorth = 8000000
-    # interval
-    dx = 1000
-    dy = 1000
+    if meshed:
+        return senorge_geometry()
     
     x = arange(LowerLeftEast, UpperRightEast, dx)
     y = arange(LowerLeftNorth, UpperRightNorth, dy)
+    return x, y
+
+def grid_checksum():
+    '''
+    Checksum of the seNorge grid definition and projection.
     
-    if meshed:
-        #Converts vector into coordinate system
+    @return: Hexadecimal MD5 digest
+    '''
+    definition = "%i %i %i %i %i %i %s" % (LowerLeftEast, LowerLeftNorth,
+                                           UpperRightEast, UpperRightNorth,
+                                           dx, dy, senorge_proj4)
+    return hashlib.md5(definition).hexdigest()
+
+def _geometry_file(name, checksum):
+    return os.path.join(pysenorgedir, 'resources',
+                        'senorge_%s_%s.npy' % (name, checksum[:12]))
+
+def senorge_geometry():
+    '''
+    Returns the meshed seNorge grid and its longitudes and latitudes.
+    
+    The inverse UTM transform is only run once: the result is saved as
+    I{resources/senorge_lon_<checksum>.npy} and I{senorge_lat_<checksum>.npy}
+    and memory-mapped by later calls and processes. The checksum of the grid
+    definition is part of the file name, so changing the definition creates
+    new files. The arrays are kept in a module-level cache and are read-only.
+    
+    @return: xgrid, ygrid, lon, lat 2-D arrays with shape (y, x)
+    '''
+    if not _geometry:
+        checksum = grid_checksum()
+        x, y = senorge_grid()
         xgrid, ygrid = meshgrid(x, y)
-        p = Proj('+proj=utm +zone=33 +ellps=WGS84 +datum=WGS84 +units=m +no_defs')
-        lon, lat = p(xgrid, ygrid, inverse=True)
+        lonlat = []
+        for name in ('lon', 'lat'):
+            fname = _geometry_file(name, checksum)
+            try:
+                a = load(fname, mmap_mode='r')
+                if a.shape != xgrid.shape:
+                    raise ValueError("Corrupt grid geometry file %s" % fname)
+            except (IOError, ValueError):
+                lonlat = None
+                break
+            lonlat.append(a)
+        if lonlat is None:
+            lonlat = _compute_lonlat(xgrid, ygrid, checksum)
+        xgrid.flags.writeable = False
+        ygrid.flags.writeable = False
+        _geometry['checksum'] = checksum
+        _geometry['grid'] = (xgrid, ygrid, lonlat[0], lonlat[1])
+    
+    return _geometry['grid']
+
+def _compute_lonlat(xgrid, ygrid, checksum):
+    '''
+    Runs the inverse UTM transform and tries to persist the result.
+    '''
+    from pyproj import Proj
+    p = Proj(senorge_proj4)
+    lon, lat = p(xgrid, ygrid, inverse=True)
+    result = []
+    for name, a in (('lon', lon), ('lat', lat)):
+        fname = _geometry_file(name, checksum)
+        try:
+            # write to a temporary file first so concurrent readers never
+            # see a partially written file
+            fd, tmpname = tempfile.mkstemp(suffix='.npy',
+                                           dir=os.path.dirname(fname))
+            fid = os.fdopen(fd, 'wb')
+            save(fid, a)
+            fid.close()
+            os.chmod(tmpname, 0644)
+            if sys.platform == 'win32' and os.path.exists(fname):
+                os.remove(fname)
+            os.rename(tmpname, fname)
+            a = load(fname, mmap_mode='r')
+        except (IOError, OSError):
+            print "Could not save grid geometry to %s" % fname
+            a.flags.writeable = False
+        result.append(a)
+    return result
+
+class LandMask(object):
+    '''
+    The seNorge no-data mask in the forms used by the IO modules and themes.
+    
+    The mask file is loaded once per process, memory-mapped, so that forked
+    workers share its pages. All other forms are derived on first use and
+    kept. Use L{land_mask} to get the shared instance.
+    
+    The BIL orientation has the northern-most row first, the netCDF
+    orientation (I{flipud}) the southern-most row.
+    '''
+    
+    def __init__(self, filename=None):
+        '''
+        @param filename: Boolean .npy file, I{True} for no-data cells -
+            default: resources/norway_mask.npy
+        '''
+        if filename is None:
+            filename = os.path.join(pysenorgedir, 'resources', 'norway_mask.npy')
+        self.filename = filename
+        self._bil = None
+        self._nc = None
+        self._ndx = {}
+    
+    def mask(self, orientation='bil'):
+        '''
+        @param orientation: "bil" or "nc"
         
-        return xgrid, ygrid, lon, lat
-    else:
-        return x, y
+        @return: Read-only boolean array, I{True} for no-data cells
+        '''
+        if self._bil is None:
+            self._bil = load(self.filename, mmap_mode='r')
+        if orientation == 'bil':
+            return self._bil
+        elif orientation == 'nc':
+            if self._nc is None:
+                self._nc = np.flipud(self._bil)
+            return self._nc
+        else:
+            raise ValueError("Unknown orientation %s" % orientation)
+    
+    def nodata_index(self, orientation='bil'):
+        '''
+        @return: Flat indices of the no-data cells
+        '''
+        return self._index('nodata', orientation)
+    
+    def land_index(self, orientation='bil'):
+        '''
+        @return: Flat indices of the land cells, row by row
+        '''
+        return self._index('land', orientation)
+    
+    def land_cells(self):
+        '''
+        @return: flatndx, rows, cols of the land cells in BIL orientation
+        '''
+        if 'cells' not in self._ndx:
+            flatndx = self.land_index('bil')
+            rows, cols = np.unravel_index(flatndx, self.shape)
+            self._ndx['cells'] = (flatndx, rows, cols)
+        return self._ndx['cells']
+    
+    def packed(self):
+        '''
+        @return: The BIL oriented mask packed into bits (see I{numpy.packbits})
+        '''
+        if 'packed' not in self._ndx:
+            self._ndx['packed'] = np.packbits(self.mask('bil'))
+        return self._ndx['packed']
+    
+    def fill(self, A, value, orientation='bil'):
+        '''
+        Sets all no-data cells of I{A} to I{value}.
+        
+        @param A: 2-D array with the shape of the seNorge grid
+        @param value: Fill value
+        @param orientation: Row order of I{A}, "bil" or "nc"
+        
+        @return: I{A}
+        '''
+        if A.shape != self.shape:
+            raise ValueError("Array shape %s differs from mask shape %s" %\
+                             (A.shape, self.shape))
+        np.put(A, self.nodata_index(orientation), value)
+        return A
+    
+    @property
+    def shape(self):
+        return self.mask('bil').shape
+    
+    def _index(self, kind, orientation):
+        key = (kind, orientation)
+        if key not in self._ndx:
+            m = self.mask(orientation)
+            if kind == 'land':
+                m = ~m
+            ndx = np.flatnonzero(m)
+            ndx.flags.writeable = False
+            self._ndx[key] = ndx
+        return self._ndx[key]
+
 
-def senorge_mask(show=False):
+_land_mask = None
+
+def land_mask():
+    '''
+    Returns the process-wide L{LandMask} instance.
+    '''
+    global _land_mask
+    if _land_mask is None:
+        _land_mask = LandMask()
+    return _land_mask
+
+def senorge_mask(show=False, orientation='bil'):
     """
-    Loads the no-data mask for senorge.
+    Returns the no-data mask for senorge, see L{LandMask}.
+    
+    @param orientation: "bil" or "nc"
     
-    @return: Boolean array
+    @return: Read-only boolean array
     """
-    mask = load(os.path.join(pysenorgedir, 'resources/norway_mask.npy'))
+    mask = land_mask().mask(orientation)
     if show:
         try:
             import matplotlib.pyplot as plt
@@ -94,25 +292,44 @@ def met_grid(ncfile, meshed=False):
     else: 
         return x, y
     
-def crop_overlap(xin, yin, zin):
+# Crop windows by hash of the input axes, see crop_window()
+_crop_windows = {}
+
+def crop_window(xin, yin):
     '''
-    Crops the input grid to the seNorge grid.
+    Index window of an input grid covering the seNorge grid.
     
-    @todo: Ensure that the input grids outline is >= than the seNorge outline 
-    '''    
-    # Get x,y of senorge grid
-    xnve, ynve = senorge_grid()
+    The window includes the last input point at or below and the first at or
+    above the seNorge outline, so that interpolation inside the outline is not
+    affected. It is clamped to the input grid if this is smaller than the
+    seNorge grid. The window is computed once per input grid.
     
-    xmin_ndx = where(xin<xnve.min())[0][-1]
-    xmax_ndx = where(xin>xnve.max())[0][0]
+    @param xin, yin: Rank-1 arrays with the increasing input axes (UTM 33).
     
-    ymin_ndx = where(yin<ynve.min())[0][-1]
-    ymax_ndx = where(yin>ynve.max())[0][0]
+    @return: rows, cols - slices to be used when reading the input data,
+        e.g. C{NCreader.read(name, tndx, rows, cols)}
+    '''
+    key = _grid_hash(xin, yin, [], [], 'crop')
+    if key not in _crop_windows:
+        xnve, ynve = senorge_grid()
+        cols = _axis_window(np.asarray(xin), xnve.min(), xnve.max())
+        rows = _axis_window(np.asarray(yin), ynve.min(), ynve.max())
+        _crop_windows[key] = (rows, cols)
+    return _crop_windows[key]
+
+def _axis_window(axis, vmin, vmax):
+    start = max(np.searchsorted(axis, vmin, side='right') - 1, 0)
+    stop = min(np.searchsorted(axis, vmax, side='left') + 1, len(axis))
+    return slice(int(start), int(stop))
 
-    xinm = xin[xmin_ndx:xmax_ndx+1] 
-    yinm = yin[ymin_ndx:ymax_ndx+1]
-    zinm = zin[ymin_ndx:ymax_ndx+1, xmin_ndx:xmax_ndx+1]
-    return xinm, yinm, zinm
+def crop_overlap(xin, yin, zin):
+    '''
+    Crops the input grid to the seNorge grid, see L{crop_window}.
+    
+    @param zin: (y, x) field or (time, y, x) stack on the input grid
+    '''    
+    rows, cols = crop_window(xin, yin)
+    return xin[cols], yin[rows], zin[..., rows, cols]
 
 def _view_grid_overlay():
     """
@@ -193,6 +410,45 @@ def is_scalar(obj):
 
 ###############################################################################
 
+def _axis_coordinates(axin, out):
+    """
+    Fractional index coordinates of I{out} on the increasing, irregular axis
+    I{axin} - see L{grid_coordinates}.
+    """
+    axin = np.asarray(axin, dtype=np.float64)
+    out = np.asarray(out, dtype=np.float64)
+    i = np.searchsorted(axin, out.ravel()) - 1
+    inside = (i >= 0) & (i < len(axin)-1)
+    coords = np.where(i < 0, -1., float(len(axin)))
+    j = i[inside]
+    coords[inside] = j + (out.ravel()[inside]-axin[j])/(axin[j+1]-axin[j])
+    return coords.reshape(out.shape)
+
+
+def grid_coordinates(xin, yin, xout, yout):
+    """
+    Computes the fractional index coordinates of the output points
+    I{xout, yout} in the input axes I{xin, yin}. The mapping is shared by
+    all orders of L{interp} and by L{Regridder}.
+    
+    Points below the range of an irregular axis get the coordinate -1, points
+    above it the length of the axis.
+    
+    @return: xcoords, ycoords with the shape of I{xout}
+    """
+    delx = xin[1:]-xin[0:-1]
+    dely = yin[1:]-yin[0:-1]
+    if max(delx)-min(delx) < 1.e-4 and max(dely)-min(dely) < 1.e-4:
+        # regular input grid.
+        xcoords = (len(xin)-1)*(xout-xin[0])/(xin[-1]-xin[0])
+        ycoords = (len(yin)-1)*(yout-yin[0])/(yin[-1]-yin[0])
+    else:
+        # irregular (but still rectilinear) input grid.
+        xcoords = _axis_coordinates(xin, xout)
+        ycoords = _axis_coordinates(yin, yout)
+    return xcoords, ycoords
+
+
 def interp(datain,xin,yin,xout,yout,checkbounds=False,masked=False,order=1):
     """This function is originally from matplotlib.toolkits.basemap.interp
     
@@ -262,36 +518,7 @@ def interp(datain,xin,yin,xout,yout,checkbounds=False,masked=False,order=1):
            yout.max() > yin.max():
             raise ValueError, 'yout or xout outside range of yin or xin'
     # compute grid coordinates of output grid.
-    delx = xin[1:]-xin[0:-1]
-    dely = yin[1:]-yin[0:-1]
-    if max(delx)-min(delx) < 1.e-4 and max(dely)-min(dely) < 1.e-4:
-        # regular input grid.
-        xcoords = (len(xin)-1)*(xout-xin[0])/(xin[-1]-xin[0])
-        ycoords = (len(yin)-1)*(yout-yin[0])/(yin[-1]-yin[0])
-    else:
-        # irregular (but still rectilinear) input grid.
-        xoutflat = xout.flatten(); youtflat = yout.flatten()
-        ix = (np.searchsorted(xin,xoutflat)-1).tolist()
-        iy = (np.searchsorted(yin,youtflat)-1).tolist()
-        xoutflat = xoutflat.tolist(); xin = xin.tolist()
-        youtflat = youtflat.tolist(); yin = yin.tolist()
-        xcoords = []; ycoords = []
-        for n,i in enumerate(ix):
-            if i < 0:
-                xcoords.append(-1) # outside of range on xin (lower end)
-            elif i >= len(xin)-1:
-                xcoords.append(len(xin)) # outside range on upper end.
-            else:
-                xcoords.append(float(i)+(xoutflat[n]-xin[i])/(xin[i+1]-xin[i]))
-        for m,j in enumerate(iy):
-            if j < 0:
-                ycoords.append(-1) # outside of range of yin (on lower end)
-            elif j >= len(yin)-1:
-                ycoords.append(len(yin)) # outside range on upper end
-            else:
-                ycoords.append(float(j)+(youtflat[m]-yin[j])/(yin[j+1]-yin[j]))
-        xcoords = np.reshape(xcoords,xout.shape)
-        ycoords = np.reshape(ycoords,yout.shape)
+    xcoords, ycoords = grid_coordinates(xin, yin, xout, yout)
     # data outside range xin,yin will be clipped to
     # values on boundary.
     if masked:
@@ -336,36 +563,342 @@ def interp(datain,xin,yin,xout,yout,checkbounds=False,masked=False,order=1):
     return dataout
 
 
-def interpolate(xold, yold, zold):
+class Regridder(object):
+    '''
+    Interpolation from one rectilinear grid to another with precomputed
+    indices and weights.
+    
+    The weights of L{interp} (order 0 or 1) are computed once per source
+    grid, target grid and order and stored as sparse matrix (if I{scipy} is
+    available) or as index and weight arrays. They are saved in
+    I{regrid_<hash>.npz} in L{regrid_cachedir}, the hash being computed from
+    the grids and the order, and reused by later processes.
+    
+    Applying the regridder to a (time, y, x) stack costs a single sparse
+    product. As in L{interp} with I{masked=False}, target points outside the
+    source grid take the values on its boundary.
+    
+    Usage::
+    
+        rg = regridder(rlon, rlat, xnew, ynew, order=1)
+        wind_intp = rg(x_wind) # (t, y, x) or (y, x)
+    '''
+    
+    def __init__(self, xin, yin, xout, yout, order=1, cachedir=None):
+        '''
+        @param xin, yin: Rank-1 arrays with the increasing source axes.
+        @param xout, yout: Rank-2 arrays with the target coordinates.
+        @param order: 0 for nearest neighbour, 1 for bilinear interpolation.
+        @param cachedir: Folder of the saved weights - default:
+            L{regrid_cachedir}. I{False} disables saving.
+        '''
+        if order not in (0, 1):
+            raise ValueError, 'order keyword must be 0 or 1'
+        if xout.shape != yout.shape:
+            raise ValueError, 'xout and yout must have same shape!'
+        self.order = order
+        self.shape_in = (len(yin), len(xin))
+        self.shape_out = xout.shape
+        self.key = _grid_hash(xin, yin, xout, yout, 'interp%i' % order)
+        
+        fname = _weights_file(cachedir, self.key)
+        weights = _load_weights(fname, ('index', 'weight'))
+        if weights is None:
+            weights = self._weights(xin, yin, xout, yout)
+            _save_weights(fname, ('index', 'weight'), weights)
+        self.index, self.weight = weights
+        self.matrix = _sparse_matrix(self.index, self.weight,
+                                     np.prod(self.shape_in))
+    
+    def _weights(self, xin, yin, xout, yout):
+        '''
+        @return: index, weight - (k, npoints) arrays of flat source indices
+            and weights, k=1 for nearest neighbour and 4 for bilinear
+        '''
+        ny, nx = self.shape_in
+        xcoords, ycoords = grid_coordinates(xin, yin, xout, yout)
+        xcoords = np.clip(xcoords, 0, nx-1).ravel()
+        ycoords = np.clip(ycoords, 0, ny-1).ravel()
+        if self.order == 0:
+            xi = np.around(xcoords).astype(np.int32)
+            yi = np.around(ycoords).astype(np.int32)
+            index = (yi*nx + xi)[np.newaxis]
+            weight = np.ones(index.shape, np.float32)
+        else:
+            xi = xcoords.astype(np.int32)
+            yi = ycoords.astype(np.int32)
+            xip1 = np.clip(xi+1, 0, nx-1)
+            yip1 = np.clip(yi+1, 0, ny-1)
+            delx = xcoords-xi
+            dely = ycoords-yi
+            index = np.array([yi*nx + xi, yip1*nx + xip1,
+                              yip1*nx + xi, yi*nx + xip1])
+            weight = np.array([(1.-delx)*(1.-dely), delx*dely,
+                               (1.-delx)*dely, delx*(1.-dely)])
+        return index, weight
+    
+    def __call__(self, data):
+        '''
+        Regrids a (y, x) field or a (time, y, x) stack.
+        
+        @return: Array with the target shape, float64 for bilinear
+        '''
+        if data.shape[-2:] != self.shape_in:
+            raise ValueError("Data shape %s does not fit the source grid %s" %\
+                             (data.shape, self.shape_in))
+        stack = np.asarray(data).reshape(-1, self.shape_in[0]*self.shape_in[1])
+        if self.matrix is not None:
+            out = self.matrix.dot(stack.T).T
+        else:
+            out = self.weight[0] * stack[:, self.index[0]]
+            for k in xrange(1, self.index.shape[0]):
+                out += self.weight[k] * stack[:, self.index[k]]
+        return out.reshape(data.shape[:-2] + self.shape_out)
+
+
+class ConservativeRegridder(object):
+    '''
+    Conservative (area-weighted) remapping from one rectilinear grid to
+    another, e.g. from the 2.5 km forecast grid to the 1 km seNorge grid.
+    
+    Each target cell receives the mean of the source cells overlapping it,
+    weighted by the overlap area. Both grids are given by their cell centres
+    in the same projected coordinates; the cell edges lie halfway between
+    the centres. Since the cells are rectangles aligned with the axes, the
+    overlap areas are the products of the overlap lengths along x and y: the
+    weight matrix is the Kronecker product of two small 1-D overlap matrices.
+    
+    The 1-D overlap matrices are saved in I{regrid_<hash>.npz} in
+    L{regrid_cachedir}.
+    The 2-D weights are applied as one sparse product (if I{scipy} is
+    available) to a (y, x) field or a (time, y, x) stack, otherwise as two
+    dense products per field.
+    
+    Target cells only partly covered by the source grid get the mean of the
+    covered part, cells outside it numpy.nan. Source cells holding numpy.nan
+    are left out of the mean.
+    
+    Usage::
+    
+        rg = regridder(xin, yin, xnew, ynew, order='conservative')
+        Rnet_intp = rg(Rnet)
+    '''
+    
+    def __init__(self, xin, yin, xout, yout, cachedir=None):
+        '''
+        @param xin, yin: Rank-1 arrays with the increasing source axes.
+        @param xout, yout: Rank-1 arrays with the increasing target axes or
+            rank-2 arrays as returned by I{senorge_grid(meshed=True)}.
+        @param cachedir: Folder of the saved weights - default:
+            L{regrid_cachedir}. I{False} disables saving.
+        '''
+        if np.ndim(xout) == 2:
+            xout, yout = xout[0, :], yout[:, 0]
+        self.shape_in = (len(yin), len(xin))
+        self.shape_out = (len(yout), len(xout))
+        self.key = _grid_hash(xin, yin, xout, yout, 'conservative')
+        
+        fname = _weights_file(cachedir, self.key)
+        weights = _load_weights(fname, ('wx', 'wy'))
+        if weights is None:
+            weights = (_overlap_weights(xin, xout), _overlap_weights(yin, yout))
+            _save_weights(fname, ('wx', 'wy'), weights)
+        self.wx, self.wy = weights
+        try:
+            from scipy.sparse import csr_matrix, kron
+            self.matrix = kron(csr_matrix(self.wy), csr_matrix(self.wx),
+                               format='csr')
+        except ImportError:
+            self.matrix = None
+        # target cells without any overlap
+        self.outside = np.logical_or.outer(self.wy.sum(axis=1) == 0,
+                                           self.wx.sum(axis=1) == 0)
+    
+    def _apply(self, stack):
+        '''
+        @param stack: (time, ny*nx) array
+        @return: (time, npoints) array of weighted sums
+        '''
+        if self.matrix is not None:
+            return self.matrix.dot(stack.T).T
+        ny, nx = self.shape_in
+        out = np.empty((stack.shape[0],) + self.shape_out)
+        for t in xrange(stack.shape[0]):
+            out[t] = self.wy.dot(stack[t].reshape(ny, nx)).dot(self.wx.T)
+        return out.reshape(stack.shape[0], -1)
+    
+    def __call__(self, data):
+        '''
+        Regrids a (y, x) field or a (time, y, x) stack.
+        
+        @return: float64 array with the target shape
+        '''
+        if data.shape[-2:] != self.shape_in:
+            raise ValueError("Data shape %s does not fit the source grid %s" %\
+                             (data.shape, self.shape_in))
+        stack = np.asarray(data).reshape(-1, self.shape_in[0]*self.shape_in[1])
+        valid = np.isfinite(stack)
+        if valid.all():
+            out = self._apply(stack)
+        else:
+            # renormalise with the weights of the valid source cells
+            out = self._apply(np.where(valid, stack, 0.))
+            frac = self._apply(valid.astype(np.float64))
+            np.putmask(frac, frac < 1.e-9, nan)
+            out /= frac
+        out = out.reshape(data.shape[:-2] + self.shape_out)
+        out[..., self.outside] = nan
+        return out
+
+
+def _cell_edges(axis):
+    '''
+    @return: Edges of the cells centred at I{axis} (len(axis)+1 values)
+    '''
+    axis = np.asarray(axis, dtype=np.float64)
+    edges = np.empty(len(axis)+1)
+    edges[1:-1] = 0.5 * (axis[1:] + axis[:-1])
+    edges[0] = axis[0] - 0.5 * (axis[1] - axis[0])
+    edges[-1] = axis[-1] + 0.5 * (axis[-1] - axis[-2])
+    return edges
+
+def _overlap_weights(axin, axout):
+    '''
+    @return: (len(axout), len(axin)) array with the overlap lengths of the
+        target and source cells, each row divided by its sum
+    '''
+    ein, eout = _cell_edges(axin), _cell_edges(axout)
+    lo = np.maximum(eout[:-1, np.newaxis], ein[np.newaxis, :-1])
+    hi = np.minimum(eout[1:, np.newaxis], ein[np.newaxis, 1:])
+    w = np.clip(hi - lo, 0., None)
+    covered = w.sum(axis=1)
+    w[covered > 0] /= covered[covered > 0, np.newaxis]
+    return w
+
+
+# Regridders in use by key
+_regridders = {}
+
+def regridder(xin, yin, xout, yout, order=1):
+    '''
+    Returns the shared L{Regridder} for the given grids and order, creating
+    it on first use.
+    
+    @param order: 0, 1 or "conservative" for a L{ConservativeRegridder}
+    '''
+    key = (order, _grid_hash(xin, yin, xout, yout, str(order)))
+    if key not in _regridders:
+        if order == 'conservative':
+            _regridders[key] = ConservativeRegridder(xin, yin, xout, yout)
+        else:
+            _regridders[key] = Regridder(xin, yin, xout, yout, order)
+    return _regridders[key]
+
+def _grid_hash(xin, yin, xout, yout, method):
+    '''
+    @return: Hash identifying the source and target grid and the method
+    '''
+    h = hashlib.md5(method)
+    for a in (xin, yin, xout, yout):
+        a = np.ascontiguousarray(a, dtype=np.float64)
+        h.update(str(a.shape))
+        h.update(a.tostring())
+    return h.hexdigest()[:16]
+
+def _sparse_matrix(index, weight, nin):
+    '''
+    @return: CSR matrix (npoints, nin) or I{None} if scipy is missing
+    '''
+    try:
+        from scipy.sparse import csr_matrix
+    except ImportError:
+        return None
+    k, npoints = index.shape
+    rows = np.repeat(np.arange(npoints), k)
+    m = csr_matrix((weight.T.ravel(), (rows, index.T.ravel())),
+                   shape=(npoints, nin))
+    # zero weights are kept: as in interp, NaN at a neighbour with zero
+    # weight gives NaN (0*NaN)
+    m.sum_duplicates()
+    return m
+
+def _weights_file(cachedir, key):
+    '''
+    @return: Path of the saved weights or I{None} if I{cachedir} is I{False}
+    '''
+    if cachedir is None:
+        cachedir = regrid_cachedir
+    if not cachedir:
+        return None
+    return os.path.join(cachedir, 'regrid_%s.npz' % key)
+
+def _load_weights(fname, names):
+    if fname is None or not os.path.exists(fname):
+        return None
+    try:
+        npz = load(fname)
+        return tuple(npz[name] for name in names)
+    except (IOError, KeyError, ValueError):
+        return None
+
+def _save_weights(fname, names, weights):
+    '''
+    Saves the weights atomically, see L{senorge_geometry}.
+    '''
+    if fname is None:
+        return
+    try:
+        if not os.path.exists(os.path.dirname(fname)):
+            try:
+                os.makedirs(os.path.dirname(fname))
+            except OSError:
+                pass # created by another process
+        fd, tmpname = tempfile.mkstemp(suffix='.npz',
+                                       dir=os.path.dirname(fname))
+        fid = os.fdopen(fd, 'wb')
+        np.savez(fid, **dict(zip(names, weights)))
+        fid.close()
+        os.chmod(tmpname, 0644)
+        if sys.platform == 'win32' and os.path.exists(fname):
+            os.remove(fname)
+        os.rename(tmpname, fname)
+    except (IOError, OSError):
+        print "Could not save regridding weights to %s" % fname
+
+
+def interpolate(xold, yold, zold, method='nearest'):
     """
     Convenience function for interpolating the UM4 grid to the seNorge grid. 
-    """
-#    print xold.shape, yold.shape, zold.shape
-
-    xcrop, ycrop, zcrop = crop_overlap(xold, yold, zold)
-    xcrop, ycrop, zcrop = xold, yold, zold
-#    print xcrop.shape, ycrop.shape, zcrop.shape
-#    print xcrop[0], xcrop[-1], ycrop[0], ycrop[-1]
-    xnew, ynew, lon, lat = senorge_grid(meshed=True) #@UnusedVariable
     
-    znew = interp(zcrop, xcrop, ycrop, xnew, ynew, checkbounds=True, masked=False, order=0)
+    Fields already on the seNorge grid (AROME) are only masked. Others are
+    cropped, see L{crop_window}, and regridded; the input may already be read
+    within the crop window, with the axes cropped accordingly.
     
-#     new_znew=zold
-#     
-#     print type(new_znew)
-#     print type(znew)
-#     
-#     print new_znew.shape 
-#     print znew.shape 
-#     
-#     print new_znew[100,100]
-#     print znew[100,100]
+    @param zold: (y, x) field or (time, y, x) stack
+    @param method: "nearest" (neighbour) or "conservative" for the
+        area-weighted mean of the overlapping cells, see
+        L{ConservativeRegridder} - use it for fluxes and accumulated fields.
+    """
+    if method not in ('nearest', 'conservative'):
+        raise ValueError("Unknown interpolation method %s" % method)
+#    print xold.shape, yold.shape, zold.shape
 
-    znew = zold
+    if zold.shape[-2:] == land_mask().shape:
+        znew = zold
+    else:
+        xcrop, ycrop, zcrop = crop_overlap(xold, yold, zold)
+#        print xcrop.shape, ycrop.shape, zcrop.shape
+#        print xcrop[0], xcrop[-1], ycrop[0], ycrop[-1]
+        xnew, ynew, lon, lat = senorge_grid(meshed=True) #@UnusedVariable
+        order = 0 if method == 'nearest' else method
+        znew = regridder(xcrop, ycrop, xnew, ynew, order)(zcrop)
     
 #   print xnew.shape, ynew.shape, znew.shape
-    mask = np.flipud(np.load(os.path.join(pysenorgedir, 'resources/norway_mask.npy')))
-    znew[mask]  = nan
+    if znew.ndim == 3:
+        for layer in znew:
+            land_mask().fill(layer, nan, 'nc')
+    else:
+        land_mask().fill(znew, nan, 'nc')
 #   from pylab import figure, imshow, show
 #   imshow(znew)
 #   figure()
@@ -386,12 +919,185 @@ def interpolate_new(zold):
     
     znew = zold
     
-    mask = np.flipud(np.load(os.path.join(pysenorgedir, 'resources/norway_mask.npy')))
-    
-    znew[mask]  = nan
+    land_mask().fill(znew, nan, 'nc')
     
     return znew
     
+class Tile(object):
+    '''
+    A row band or tile of a grid, optionally extended by a halo of
+    neighbouring cells, see L{grid_tiles}.
+    '''
+    
+    def __init__(self, rows, cols, halo, shape):
+        '''
+        @param rows, cols: Slices of the tile in the grid, without halo.
+        @param halo: Number of neighbouring cells added on each side.
+        @param shape: Shape (rows, cols) of the grid.
+        '''
+        self.rows = rows
+        self.cols = cols
+        r0 = max(rows.start - halo, 0)
+        c0 = max(cols.start - halo, 0)
+        self.outer_rows = slice(r0, min(rows.stop + halo, shape[0]))
+        self.outer_cols = slice(c0, min(cols.stop + halo, shape[1]))
+        self.inner_rows = slice(rows.start - r0, rows.stop - r0)
+        self.inner_cols = slice(cols.start - c0, cols.stop - c0)
+    
+    def read(self, A):
+        '''
+        @return: View of the tile including its halo in the last two
+            dimensions of I{A}
+        '''
+        return A[..., self.outer_rows, self.outer_cols]
+    
+    def write(self, out, A):
+        '''
+        Copies the tile result I{A} without its halo into I{out}.
+        '''
+        out[..., self.rows, self.cols] = A[..., self.inner_rows,
+                                             self.inner_cols]
+
+
+def grid_tiles(shape, nrows=None, ncols=None, halo=0):
+    '''
+    Splits a grid into row bands or tiles.
+    
+    @param shape: Shape (rows, cols) of the grid, e.g. of the seNorge grid.
+    @param nrows: Rows per tile - default: all rows
+    @param ncols: Columns per tile - default: all columns (row bands)
+    @param halo: Number of neighbouring cells added on each side, e.g. for
+        filters or gradients.
+    
+    @return: List of L{Tile}
+    '''
+    ny, nx = shape
+    nrows = nrows or ny
+    ncols = ncols or nx
+    return [Tile(slice(r, min(r+nrows, ny)), slice(c, min(c+ncols, nx)),
+                 halo, shape)
+            for r in xrange(0, ny, nrows) for c in xrange(0, nx, ncols)]
+
+
+def band_rows(arrays, maxbytes=64*2**20, ncols=None, nworkers=1,
+              temporaries=4):
+    '''
+    Number of rows per tile keeping the memory used by all workers within
+    I{maxbytes}.
+    
+    @param arrays: Input arrays with the grid in the last two dimensions.
+    @param ncols: Columns per tile - default: all columns
+    @param temporaries: Number of float64 (time, y, x) temporaries the tile
+        function creates per input, e.g. 4 for M{sqrt(x**2 + y**2)}.
+    '''
+    ny, nx = arrays[0].shape[-2:]
+    bytes_per_cell = 0
+    for A in arrays:
+        nlayers = int(np.prod(A.shape[:-2]))
+        bytes_per_cell += nlayers * (A.itemsize + 8*temporaries)
+    ncols = ncols or nx
+    nrows = maxbytes // (bytes_per_cell * ncols * max(nworkers, 1))
+    return int(min(max(nrows, 1), ny))
+
+
+def map_tiles(func, arrays, nrows=None, ncols=None, halo=0, nworkers=1,
+              processes=False, maxbytes=64*2**20, out=None):
+    '''
+    Applies I{func} tile by tile and assembles its results on the full grid.
+    
+    I{func} is called with the tiles of all I{arrays}, views of their last
+    two dimensions including the halo, and returns an array or a tuple of
+    arrays with the same last two dimensions, e.g. a (y, x) result of
+    (time, y, x) inputs. The outputs are allocated once for the full grid
+    (or passed by I{out}) and filled in place, so only a few tiles of
+    temporaries exist at any time.
+    
+    Usage::
+    
+        total_wind_avg, max_wind, wind_dir = map_tiles(model,
+                                                       (x_wind, y_wind),
+                                                       nworkers=4,
+                                                       processes=True)
+    
+    @param func: Tile function; a module level function if I{processes}.
+    @param arrays: Input arrays with the grid in the last two dimensions.
+    @param nrows: Rows per tile - default: from I{maxbytes}, see
+        L{band_rows}
+    @param ncols: Columns per tile - default: all columns (row bands)
+    @param halo: Number of neighbouring cells passed on each side.
+    @param nworkers: Number of threads or processes, 1 runs in this thread.
+    @param processes: Use a process pool instead of a thread pool. Threads
+        suit numpy code, which runs in parallel on large arrays; processes
+        suit pure Python loops, at the cost of copying the tiles.
+    @param maxbytes: Memory budget of all workers.
+    @param out: Output array or tuple of arrays - default: allocated from the
+        result of the first tile
+    
+    @return: Output array or tuple of arrays
+    '''
+    shape = arrays[0].shape[-2:]
+    for A in arrays:
+        if A.shape[-2:] != shape:
+            raise ValueError("Array shape %s does not fit the grid %s" %\
+                             (A.shape, shape))
+    if nrows is None:
+        nrows = band_rows(arrays, maxbytes, ncols, nworkers)
+    tiles = grid_tiles(shape, nrows, ncols, halo)
+    if out is None:
+        outputs = []
+    elif isinstance(out, tuple):
+        outputs = list(out)
+    else:
+        outputs = [out]
+    
+    def store(tile, results):
+        if not outputs:
+            outputs.extend(np.empty(R.shape[:-2] + shape, R.dtype)
+                           for R in results)
+        for O, R in zip(outputs, results):
+            tile.write(O, R)
+    
+    if nworkers <= 1:
+        for tile in tiles:
+            store(tile, _tile_job(func, [tile.read(A) for A in arrays]))
+    else:
+        if processes:
+            from multiprocessing import Pool
+        else:
+            from multiprocessing.pool import ThreadPool as Pool
+        pool = Pool(nworkers)
+        try:
+            # keep at most two tiles per worker in flight
+            pending = []
+            for tile in tiles:
+                args = [tile.read(A) for A in arrays]
+                pending.append((tile, pool.apply_async(_tile_job,
+                                                       (func, args))))
+                if len(pending) >= 2*nworkers:
+                    tile, job = pending.pop(0)
+                    store(tile, job.get())
+            for tile, job in pending:
+                store(tile, job.get())
+            pool.close()
+        except:
+            pool.terminate()
+            raise
+        finally:
+            pool.join()
+    
+    if len(outputs) == 1 and not isinstance(out, tuple):
+        return outputs[0]
+    return tuple(outputs)
+
+def _tile_job(func, args):
+    '''
+    Calls the tile function, see L{map_tiles}.
+    '''
+    results = func(*args)
+    if not isinstance(results, tuple):
+        results = (results,)
+    return results
+    
 if __name__ == '__main__':
 #    x, y, lon, lat = senorge_grid(True)
 #    print lon.shape
@@ -7,13 +7,121 @@ Binary (.bil) input/output class.
 '''
 # Built-in
 import os, sys
+import threading
+import tempfile
+import zlib, bz2
+from datetime import timedelta
 sys.path.append(os.path.abspath('../..'))
 
 # Additional
-from numpy import zeros, fromfile, int8, int16, uint8, uint16, float32, nan
+from numpy import zeros, empty, fromfile, frombuffer, memmap, ndarray, array, \
+                  dtype, ascontiguousarray, \
+                  int8, int16, uint8, uint16, float32, nan
 
 # Own
 from pysenorge.converters import get_FillValue
+from pysenorge.io.cache import layer_cache
+from pysenorge.tools.date_converters import datetime2BILdate, get_hydroyear
+
+# Parsed .hdr files, one dictionary per directory keyed by the header text.
+# All files of a theme season share the same header, thus it is parsed once.
+_hdr_cache = {}
+
+_hdr_int_keys = ['NROWS', 'NCOLS', 'NBANDS', 'NBITS', 'BANDROWBYTES',
+                 'TOTALROWBYTES', 'BANDGAPBYTES', 'SKIPBYTES', 'NCELLS',
+                 'BLOCKROWS']
+
+# Codecs for compressed BIL files (LAYOUT CBIL): name -> (compress, decompress)
+_codecs = {'zlib': (zlib.compress, zlib.decompress),
+           'bz2': (bz2.compress, bz2.decompress)}
+
+
+def read_hdr(hdrfile):
+    """
+    Reads an ESRI *.hdr* file belonging to a BIL file.
+    
+    Parsed headers are cached per directory. A header is only parsed again if
+    its content differs from all headers already seen in that directory.
+    
+    :Parameters:
+        - hdrfile: Path to the *.hdr* file
+    
+    :Returns: Dictionary with upper case keywords, e.g. NROWS, NCOLS, NBANDS,
+        NBITS and BYTEORDER, or *None* if the file does not exist.
+    """
+    if not os.path.exists(hdrfile):
+        return None
+    fid = open(hdrfile, 'r')
+    text = fid.read()
+    fid.close()
+    dircache = _hdr_cache.setdefault(os.path.dirname(os.path.abspath(hdrfile)),
+                                     {})
+    if text not in dircache:
+        dircache[text] = _parse_hdr(text)
+    return dict(dircache[text])
+
+
+def clear_hdr_cache():
+    """
+    Empties the cache of parsed *.hdr* files.
+    """
+    _hdr_cache.clear()
+
+
+def _parse_hdr(text):
+    """
+    Parses the content of a *.hdr* file. Unknown keywords are kept as strings.
+    """
+    hdr = {}
+    for line in text.splitlines():
+        items = line.split(None, 1)
+        if len(items) != 2:
+            continue
+        key = items[0].upper()
+        value = items[1].strip()
+        if key in _hdr_int_keys:
+            value = int(value)
+        elif key == 'BANDNAMES':
+            value = value.split()
+        hdr[key] = value
+    return hdr
+
+
+def land_cells():
+    """
+    Returns the indices of the cells inside the seNorge mask.
+    
+    The order of the cells (row by row) is the order in which packed BIL
+    files store their values. A packed vector *v* is thus expanded by
+    *grid.flat[flatndx] = v*.
+    
+    :Returns: flatndx, rows, cols
+    """
+    from pysenorge.grid import land_mask
+    return land_mask().land_cells()
+
+
+def register_codec(name, compress, decompress):
+    """
+    Makes a compression method available for compressed BIL files.
+    
+    :Parameters:
+        - name: Name of the codec as stored in the CODEC entry of the *.hdr* file
+        - compress: Function compressing a string of bytes
+        - decompress: Function restoring the original string of bytes
+    """
+    _codecs[name] = (compress, decompress)
+
+
+def _byteorder_char(byteorder):
+    """
+    Translates the BYTEORDER keyword to a *numpy* byte order character.
+    Both the ESRI notation (I/M) and *sys.byteorder* (little/big) are accepted.
+    """
+    if byteorder.upper() in ['M', 'BIG', 'MOTOROLA']:
+        return '>'
+    else:
+        return '<'
 
 
 class BILdata(object):
@@ -24,85 +132,445 @@ class BILdata(object):
     The seNorge array has a standard size of height=1550, width=1195.
     The standard data-type is "uint16" with a no-data-value of 65535.
     The standard file name is of type "themename_YYYY_MM_DD.bil"  
+    
+    If a *.hdr* file exists next to the BIL file its NROWS, NCOLS, NBANDS,
+    NBITS, PIXELTYPE and BYTEORDER entries override the defaults on reading.
+    Files with several bands are band interleaved by line (BIL), i.e. each
+    image row holds one row of every band. Their data is presented as a
+    (band, row, column) array.
+    
+    Packed files (LAYOUT PACKED in the *.hdr* file) only contain the cells
+    inside the seNorge mask, see *land_cells*. They are expanded to the full
+    grid on reading; the packed values are kept in *self.packed*.
+    
+    Compressed files (LAYOUT CBIL) split the grid into blocks of BLOCKROWS
+    rows which are compressed independently by the codec named in CODEC. The
+    file starts with a table of the block offsets (little endian uint64), so
+    *read_window* only decompresses the blocks covering the requested rows.
+    Blocks are decompressed in parallel by *nthreads* threads.
     '''
 
-    def __init__(self, filename, datatype):
+    def __init__(self, filename, datatype, nbands=1, bandnames=None,
+                 packed=False, codec=None, blockrows=64):
         '''
         Initializes defaults.
+        
+        :Parameters:
+            - filename: Path to the BIL file
+            - datatype: Data-type name, e.g. "uint16"
+            - nbands: Number of bands - default: 1
+            - bandnames: Optional list of names for the bands
+            - packed: If *True* only the cells inside the seNorge mask are
+              written (single band only)
+            - codec: Name of a registered codec, e.g. "zlib", to write a
+              compressed file
+            - blockrows: Number of rows per compressed block
         '''
         self.nrows = 1550
         self.ncols = 1195
-        self.datatype = eval(datatype)
+        self.nbands = nbands
+        self.bandnames = bandnames
+        self.byteorder = '<' if sys.byteorder == 'little' else '>'
+        self.skipbytes = 0
+        self.layout = 'PACKED' if packed else 'BIL'
+        if codec is not None:
+            self.layout = 'CBIL'
+        self.codec = codec
+        self.blockrows = blockrows
+        self.nthreads = 4
+        self.packed = None
+        self.ncells = 0
+        self.datatype = dtype(datatype).type
         self.nodata = get_FillValue(self.datatype)
-        self.data = zeros((self.nrows, self.ncols), self.datatype)
+        self.data = zeros(self._shape(), self.datatype)
         self.filename = filename
         
         
-    def _set_dimension(self, nrows, ncols):
+    def _set_dimension(self, nrows, ncols, nbands=1):
         '''
         Override standard dimensions.
         
         :Parameters:
             - nrows: Number of new rows
             - ncols: Number of new columns  
+            - nbands: Number of new bands
         '''
         self.nrows = nrows
         self.ncols = ncols
-        self.data = zeros((self.nrows, self.ncols), self.datatype)
+        self.nbands = nbands
+        self.data = zeros(self._shape(), self.datatype)
+        
+        
+    def _shape(self):
+        """
+        Shape of the data array: (row, column) or (band, row, column).
+        """
+        if self.nbands == 1:
+            return (self.nrows, self.ncols)
+        else:
+            return (self.nbands, self.nrows, self.ncols)
         
     
-    def read(self):
+    def read(self, mmap=False, expand=True):
         """
         Reads data from BIL file.
+        
+        :Parameters:
+            - mmap: If *True* the file is mapped with *numpy.memmap* instead
+              of being read into memory. Only the pages touched when slicing
+              *self.data* are loaded from disk, e.g. a row band or the window
+              around one county. The data is read-only in this mode.
+            - expand: Packed files only - if *False* only the vector of land
+              cells is read into *self.packed*. Use *expand()* to get the
+              full grid later on.
+        
+        If the process-wide layer cache is enabled (see
+        *pysenorge.io.cache*) the data is shared with other readers of the
+        same file and is read-only.
         """
+        self._read_hdr()
+        self.packed = None
+        key = None
+        if layer_cache.enabled() and not mmap and expand:
+            # write() replaces the file by a new one, so the inode changes
+            # even if the mtime resolution is too coarse to tell
+            st = os.stat(self.filename)
+            key = (os.path.abspath(self.filename), st.st_mtime, st.st_ino,
+                   st.st_size, dtype(self.datatype).str)
+            data = layer_cache.get(key)
+            if data is not None:
+                print "Reading %s (cached)" % self.filename
+                self.data = data
+                if self.layout == 'PACKED':
+                    flatndx, rows, cols = land_cells() #@UnusedVariable
+                    self.packed = data[rows, cols]
+                return
         print "Reading %s" % self.filename
-#        self._read_hdr()
-        fid = open(self.filename, "rb")
-        tmpdata = fromfile(fid, self.datatype)
-        fid.close()
-        tmpdata.shape = (self.nrows, self.ncols)
-        self.data[:] = tmpdata
+        if self.layout == 'PACKED':
+            self._read_packed(mmap, expand)
+        elif self.layout == 'CBIL':
+            buf, r0 = self._read_blocks(0, self.nrows)
+            self.data = self._layout(buf, self.nrows)
+        elif mmap:
+            self.data = self._layout(memmap(self.filename, dtype=uint8,
+                                            mode='r'))
+        else:
+            # Read the file once - the data array is a view on this buffer
+            self.data = self._layout(fromfile(self.filename, uint8))
+        if key is not None:
+            layer_cache.put(key, self.data)
 #        self._get_mask()
 
 
-    def write(self, data):
+    def read_window(self, rows=None, cols=None):
+        """
+        Reads a sub-window of the grid without loading the whole file.
+        
+        :Parameters:
+            - rows: (first, last) row indices, *last* excluded - default: all
+            - cols: (first, last) column indices, *last* excluded - default: all
+        
+        :Returns: *numpy* array containing only the requested window (of all
+            bands). The window is also stored in *self.data*.
+        """
+        if rows is None:
+            rows = (0, self.nrows)
+        if cols is None:
+            cols = (0, self.ncols)
+        self._read_hdr()
+        if self.layout == 'PACKED':
+            self._read_packed(False, True)
+            self.data = self.data[rows[0]:rows[1], cols[0]:cols[1]].copy()
+            return self.data
+        if self.layout == 'CBIL':
+            buf, r0 = self._read_blocks(rows[0], rows[1])
+            nrows = buf.size / (self.nbands * self.ncols *
+                                dtype(self.datatype).itemsize)
+            block = self._layout(buf, nrows)
+            self.data = array(block[..., rows[0]-r0:rows[1]-r0,
+                                    cols[0]:cols[1]])
+            return self.data
+        mm = self._memmap()
+        self.data = array(mm[..., rows[0]:rows[1], cols[0]:cols[1]])
+        del mm # closes the mapping
+        return self.data
+    
+    
+    def band(self, band):
+        """
+        Returns the data of a single band.
+        
+        :Parameters:
+            - band: Band index or name as given in *bandnames*
+        """
+        if self.nbands == 1:
+            return self.data
+        if not isinstance(band, int):
+            band = self.bandnames.index(band)
+        return self.data[band]
+    
+    
+    def expand(self):
+        """
+        Expands the packed land cells to the full grid, non-land cells are set
+        to the no-data value.
+        
+        :Returns: (row, column) *numpy* array, also stored in *self.data*
+        """
+        flatndx = land_cells()[0]
+        self.data = empty((self.nrows, self.ncols), self.datatype)
+        self.data.fill(self.nodata)
+        self.data.flat[flatndx] = self.packed
+        return self.data
+    
+    
+    def _read_packed(self, mmap, expand):
+        """
+        Reads the land cells of a packed file into *self.packed*.
+        """
+        flatndx = land_cells()[0]
+        if self.ncells == 0:
+            self.ncells = flatndx.size
+        if self.ncells != flatndx.size:
+            raise IOError("%s holds %i cells, the seNorge mask %i" %\
+                          (self.filename, self.ncells, flatndx.size))
+        dt = dtype(self.datatype).newbyteorder(self.byteorder)
+        if mmap:
+            self.packed = memmap(self.filename, dtype=dt, mode='r',
+                                 offset=self.skipbytes, shape=(self.ncells,))
+        else:
+            fid = open(self.filename, 'rb')
+            fid.seek(self.skipbytes)
+            self.packed = fromfile(fid, dt, self.ncells)
+            fid.close()
+        if not dt.isnative:
+            self.packed = self.packed.astype(dt.newbyteorder('='))
+        if expand:
+            self.expand()
+    
+    
+    def _read_blocks(self, first, last):
+        """
+        Decompresses the blocks of a compressed file covering the rows
+        *first* to *last* (excluded).
+        
+        :Returns: uint8 buffer with the raw BIL rows of these blocks and the
+            index of its first row
+        """
+        decompress = _codecs[self.codec][1]
+        rowbytes = self.nbands * self.ncols * dtype(self.datatype).itemsize
+        nblocks = (self.nrows + self.blockrows - 1) / self.blockrows
+        b0 = first / self.blockrows
+        b1 = (last - 1) / self.blockrows + 1
+        
+        fid = open(self.filename, 'rb')
+        offsets = fromfile(fid, '<u8', nblocks + 1).astype(int)
+        fid.seek(offsets[b0])
+        blobs = fid.read(offsets[b1] - offsets[b0])
+        fid.close()
+        
+        r0 = b0 * self.blockrows
+        r1 = min(b1 * self.blockrows, self.nrows)
+        buf = empty((r1 - r0) * rowbytes, uint8)
+        def worker(blocks):
+            for b in blocks:
+                blob = blobs[offsets[b]-offsets[b0]:offsets[b+1]-offsets[b0]]
+                start = (b - b0) * self.blockrows * rowbytes
+                raw = frombuffer(decompress(blob), uint8)
+                buf[start:start+raw.size] = raw
+        blocks = range(b0, b1)
+        threads = [threading.Thread(target=worker,
+                                    args=(blocks[n::self.nthreads],))
+                   for n in range(min(self.nthreads, len(blocks)))]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        return buf, r0
+    
+    
+    def _memmap(self):
+        """
+        Maps the BIL file into memory (read-only).
+        """
+        self._read_hdr()
+        return self._layout(memmap(self.filename, dtype=uint8, mode='r'))
+    
+    
+    def _layout(self, buf, nrows=None):
+        """
+        Arranges the raw bytes of a BIL file as (row, column) or
+        (band, row, column) array without copying.
+        
+        :Parameters:
+            - buf: *numpy* uint8 array holding the file content
+            - nrows: Number of rows in *buf* - default: all rows
+        """
+        if nrows is None:
+            nrows = self.nrows
+            skipbytes = self.skipbytes
+        else:
+            skipbytes = 0 # decompressed blocks
+        dt = dtype(self.datatype).newbyteorder(self.byteorder)
+        bandrowbytes = self.ncols * dt.itemsize
+        totalrowbytes = self.nbands * bandrowbytes
+        if buf.size - skipbytes < nrows * totalrowbytes:
+            raise IOError("%s is smaller than given by its dimensions: %i x %i x %i" %\
+                          (self.filename, self.nbands, self.nrows, self.ncols))
+        data = ndarray((nrows, self.nbands, self.ncols), dt, buffer=buf,
+                       offset=skipbytes,
+                       strides=(totalrowbytes, bandrowbytes, dt.itemsize))
+        if not dt.isnative:
+            data = data.astype(dt.newbyteorder('='))
+        if self.nbands == 1:
+            return data[:, 0, :]
+        else:
+            return data.transpose(1, 0, 2)
+
+
+    def write(self, data, hdr=False, scale=None, mask=None, fsync=False,
+              batch=None, chunkrows=64):
         '''
         Writes data to BIL file.
         
+        The data is written in bands of *chunkrows* rows, thus *data* may be
+        any view - e.g. *flipud(x)* - without being copied as a whole. The
+        file is first written under a temporary name and renamed when
+        complete, so an interrupted run never leaves a truncated BIL file.
+        
         :Parameters:
-            - data: *numpy* array to be stored
+            - data: *numpy* array to be stored, (band, row, column) for files
+              with more than one band
+            - hdr: If *True* a *.hdr* file is written as well. This is always
+              done for files with more than one band, packed and compressed
+              files, and if a *.hdr* file exists already - it may describe
+              another layout.
+            - scale: If given, *data* is multiplied by *scale* and converted to
+              the BIL data-type on the fly, e.g. scale=10.0 to store 0.1 m/s.
+            - mask: Boolean (row, column) array, *True* cells are set to the
+              no-data value
+            - fsync: If *True* the file is forced to disk before renaming
+            - batch: *BILsyncBatch* collecting files to be forced to disk
+              together, e.g. when back-filling a season
+            - chunkrows: Number of rows converted and written at a time
         '''
         # Make sure data is in appropriate format
-        if self.data.dtype == data.dtype:
-            # Open and write to file
-            fid = open(self.filename, 'wb')
-            fid.write(data)
+        if scale is None and dtype(self.datatype) != data.dtype:
+            print "Inconsistent data-type for BIL format."
+            return
+        data = data.reshape(self._shape())
+        if self.layout == 'PACKED':
+            if self.nbands > 1:
+                raise ValueError("Packed BIL files have a single band only.")
+            # Only the land cells in their fixed order
+            flatndx, rows, cols = land_cells()
+            bildata = data[rows, cols]
+            if mask is not None:
+                mask = mask[rows, cols]
+            self.ncells = flatndx.size
+            hdr = True
+        elif self.nbands > 1:
+            # Interleave the bands by line
+            bildata = data.transpose(1, 0, 2)
+            hdr = True
+        else:
+            bildata = data
+        if self.layout == 'CBIL':
+            hdr = True
+        
+        # Write to a temporary file in the same folder
+        fd, tmpname = tempfile.mkstemp(suffix='.tmp',
+                                       prefix=os.path.basename(self.filename),
+                                       dir=os.path.dirname(os.path.abspath(self.filename)))
+        fid = os.fdopen(fd, 'wb')
+        try:
+            nrows = bildata.shape[0]
+            if self.layout == 'PACKED':
+                chunkrows *= self.ncols # cells instead of rows
+            elif self.layout == 'CBIL':
+                # One chunk per block, preceded by the table of offsets
+                compress = _codecs[self.codec][0]
+                chunkrows = self.blockrows
+                offsets = zeros((nrows + chunkrows - 1) / chunkrows + 1, '<u8')
+                fid.write(offsets)
+                offsets[0] = fid.tell()
+            for r0 in xrange(0, nrows, chunkrows):
+                r1 = min(r0 + chunkrows, nrows)
+                if scale is None:
+                    chunk = array(bildata[r0:r1], copy=mask is not None)
+                else:
+                    chunk = bildata[r0:r1] * scale
+                chunk = ascontiguousarray(chunk, self.datatype)
+                if mask is not None:
+                    if self.nbands > 1:
+                        for b in xrange(self.nbands):
+                            chunk[:, b, :][mask[r0:r1]] = self.nodata
+                    else:
+                        chunk[mask[r0:r1]] = self.nodata
+                if self.layout == 'CBIL':
+                    fid.write(compress(chunk.tostring()))
+                    offsets[r0 / chunkrows + 1] = fid.tell()
+                else:
+                    fid.write(chunk)
+            if self.layout == 'CBIL':
+                fid.seek(0)
+                fid.write(offsets)
             fid.flush()
+            if fsync:
+                os.fsync(fid.fileno())
             fid.close()
-            self.data = data
-            return "Data written to %s" % self.filename
-        else:
-            print "Inconsistent data-type for BIL format."
+            if sys.platform == 'win32' and os.path.exists(self.filename):
+                os.remove(self.filename) # rename does not replace on Windows
+            os.rename(tmpname, self.filename)
+        except:
+            fid.close()
+            os.remove(tmpname)
+            raise
+        if batch is not None:
+            batch.add(self.filename)
+        self.data = data
+        if hdr or os.path.exists(self._hdrfile()):
+            self._write_hdr()
+        return "Data written to %s" % self.filename
             
             
     def _read_hdr(self):
         """
-        Reads header information from *.hdr* file (if existent).
-        """
-        hdr = os.path.splitext(self.filename)[0] + '.hdr'
-        if os.path.exists(hdr):
-            # Verify the information
-            fid = open(hdr, 'r')
-            lines = fid.readlines()
-            byteorder = int(lines[0].split('\t')[1].strip())
-            nrows = int(lines[2].split('\t')[1].strip())
-            ncols = int(lines[3].split('\t')[1].strip())
-            print "BYTEORDER: %i \nNROWS: %i \nNCOLS: %i\n" % (byteorder, nrows, ncols)
-            self._set_dimension(nrows, ncols)
-        else:
-            print "No header data found! Using default..."
+        Reads header information from *.hdr* file (if existent) and overrides
+        the default dimensions, data-type and byte order.
+        """
+        hdr = read_hdr(self._hdrfile())
+        if hdr is None:
+            return
+        self.nrows = hdr.get('NROWS', self.nrows)
+        self.ncols = hdr.get('NCOLS', self.ncols)
+        self.nbands = hdr.get('NBANDS', 1)
+        self.bandnames = hdr.get('BANDNAMES', self.bandnames)
+        self.skipbytes = hdr.get('SKIPBYTES', 0)
+        self.layout = hdr.get('LAYOUT', 'BIL').upper()
+        self.ncells = hdr.get('NCELLS', 0)
+        self.codec = hdr.get('CODEC', self.codec)
+        self.blockrows = hdr.get('BLOCKROWS', self.blockrows)
+        if 'BYTEORDER' in hdr:
+            self.byteorder = _byteorder_char(hdr['BYTEORDER'])
+        # Data-type: PIXELTYPE if given, else keep the kind of the given type
+        nbits = hdr.get('NBITS', dtype(self.datatype).itemsize * 8)
+        kind = dtype(self.datatype).kind
+        pixeltype = hdr.get('PIXELTYPE', '').upper()
+        if pixeltype == 'SIGNEDINT':
+            kind = 'i'
+        elif pixeltype == 'FLOAT':
+            kind = 'f'
+        elif pixeltype == 'UNSIGNEDINT':
+            kind = 'u'
+        self.datatype = dtype('%s%i' % (kind, nbits / 8)).type
+        self.nodata = get_FillValue(self.datatype)
               
     
+    def _hdrfile(self):
+        return os.path.splitext(self.filename)[0] + '.hdr'
+    
+    
     def _write_hdr(self):
         ''' 
         Creates a I{.hdr} file to the corresponding I{.bil} file.
@@ -118,17 +586,33 @@ class BILdata(object):
         TOTALROWBYTES        2390
         BANDGAPBYTES         0
         '''
-        hdr = os.path.splitext(self.filename)[0] + '.hdr'
-        fid = open(hdr, 'w')
-        fid.write('BYTEORDER\t%s\n' % sys.byteorder)
-        fid.write('LAYOUT\tBIL\n')
+        dt = dtype(self.datatype)
+        if dt.kind == 'i':
+            pixeltype = 'SIGNEDINT'
+        elif dt.kind == 'f':
+            pixeltype = 'FLOAT'
+        else:
+            pixeltype = 'UNSIGNEDINT'
+        bandrowbytes = self.ncols * dt.itemsize
+        fid = open(self._hdrfile(), 'w')
+        fid.write('BYTEORDER\t%s\n' % ('I' if self.byteorder == '<' else 'M'))
+        fid.write('LAYOUT\t%s\n' % self.layout)
         fid.write('NROWS\t%i\n' % self.nrows)
         fid.write('NCOLS\t%i\n' % self.ncols)
-        fid.write('NBANDS\t1\n')
-        fid.write('NBITS\t16\n')
-        fid.write('BANDROWBYTES\t2390\n')
-        fid.write('TOTALROWBYTES\t2390\n')
+        fid.write('NBANDS\t%i\n' % self.nbands)
+        fid.write('NBITS\t%i\n' % (dt.itemsize * 8))
+        fid.write('PIXELTYPE\t%s\n' % pixeltype)
+        fid.write('BANDROWBYTES\t%i\n' % bandrowbytes)
+        fid.write('TOTALROWBYTES\t%i\n' % (self.nbands * bandrowbytes))
         fid.write('BANDGAPBYTES\t0\n')
+        if self.layout == 'PACKED':
+            fid.write('NCELLS\t%i\n' % self.ncells)
+            fid.write('MASK\tnorway_mask\n')
+        elif self.layout == 'CBIL':
+            fid.write('CODEC\t%s\n' % self.codec)
+            fid.write('BLOCKROWS\t%i\n' % self.blockrows)
+        if self.bandnames is not None:
+            fid.write('BANDNAMES\t%s\n' % ' '.join(self.bandnames))
         fid.flush()
         fid.close()   
         
@@ -173,6 +657,170 @@ class BILdata(object):
             
         except ImportError:
             print '''Required plotting module "matplotlib" not found!\nVisit www.matplotlib.sf.net'''
+            
+
+class BILsyncBatch(object):
+    '''
+    Forces written BIL files to disk in batches.
+    
+    Calling *fsync* after each file slows down the back-filling of a season
+    considerably. Instead the files are collected and synchronised together
+    once *size* files have been written, and when *sync* is called.
+    
+    Usage::
+        
+        batch = BILsyncBatch(50)
+        for ...:
+            bd.write(data, batch=batch)
+        batch.sync()
+    '''
+    
+    def __init__(self, size=50):
+        self.size = size
+        self.filenames = []
+        
+        
+    def add(self, filename):
+        """
+        Adds a written file, and synchronises the batch if it is full.
+        """
+        self.filenames.append(filename)
+        if len(self.filenames) >= self.size:
+            self.sync()
+            
+            
+    def sync(self):
+        """
+        Forces all collected files and their folders to disk.
+        """
+        dirs = set()
+        for filename in self.filenames:
+            fid = open(filename, 'rb+')
+            os.fsync(fid.fileno())
+            fid.close()
+            dirs.add(os.path.dirname(os.path.abspath(filename)))
+        if sys.platform != 'win32':
+            # The renames are only durable once the folder entry is synced
+            for d in dirs:
+                fd = os.open(d, os.O_RDONLY)
+                os.fsync(fd)
+                os.close(fd)
+        self.filenames = []
+        
+
+class BILStack(object):
+    '''
+    Loads the daily BIL files of one theme for a period into a single
+    (time, row, column) array.
+    
+    The file paths follow the standard layout
+    "basedir/themename/HYDROYEAR/themename_YYYY_MM_DD.bil". The array is
+    allocated once and each file is read directly into its time slice by a
+    pool of threads, thus loading a season is limited by the disk and not by
+    temporary copies. Days without a file are set to the no-data value and
+    listed in *missing*.
+    
+    Usage::
+        
+        stack = BILStack('sd', datetime(2010, 9, 1), datetime(2011, 6, 30))
+        cube = stack.read()
+    '''
+    
+    def __init__(self, themename, startdate, enddate, datatype='uint16',
+                 basedir=None, nthreads=4):
+        '''
+        Initializes the list of dates and file paths.
+        
+        :Parameters:
+            - themename: Short name of the theme, e.g. "sd"
+            - startdate: First day as *datetime* object
+            - enddate: Last day (included) as *datetime* object
+            - datatype: Data-type name used if the files have no *.hdr* file
+            - basedir: Folder containing the theme folders - default: BILout
+            - nthreads: Number of reading threads
+        '''
+        if basedir is None:
+            from pysenorge.set_environment import BILout
+            basedir = BILout
+        self.themename = themename
+        self.datatype = datatype
+        self.nthreads = nthreads
+        self.dates = []
+        self.filenames = []
+        cdate = startdate
+        while cdate <= enddate:
+            self.dates.append(cdate)
+            self.filenames.append(os.path.join(basedir, themename,
+                                               str(get_hydroyear(cdate)),
+                                               "%s_%s.bil" % (themename,
+                                                    datetime2BILdate(cdate))))
+            cdate += timedelta(days=1)
+        self.missing = []
+        self.data = None
+        
+        
+    def read(self):
+        """
+        Reads all files of the period.
+        
+        :Returns: (time, row, column) *numpy* array, also stored in *self.data*.
+        """
+        existing = [f for f in self.filenames if os.path.exists(f)]
+        self.missing = [d for d, f in zip(self.dates, self.filenames)
+                        if not os.path.exists(f)]
+        # The layout of the first file is valid for the whole stack
+        layout = BILdata(existing[0] if existing else "", self.datatype)
+        if existing:
+            layout._read_hdr()
+        if layout.nbands != 1 or layout.layout != 'BIL':
+            raise ValueError("BILStack supports single band, uncompressed files only: %s" %
+                             existing[0])
+        self._layout = layout
+        self.data = empty((len(self.filenames), layout.nrows, layout.ncols),
+                          layout.datatype)
+        
+        todo = range(len(self.filenames))
+        threads = []
+        errors = []
+        for n in range(self.nthreads):
+            t = threading.Thread(target=self._worker,
+                                 args=(todo[n::self.nthreads], errors))
+            t.start()
+            threads.append(t)
+        for t in threads:
+            t.join()
+        if errors:
+            raise errors[0]
+        return self.data
+    
+    
+    def _worker(self, indices, errors):
+        """
+        Reads the files with the given time indices into the stack.
+        """
+        try:
+            for i in indices:
+                self._read_into(self.filenames[i], self.data[i])
+        except Exception, e:
+            errors.append(e)
+    
+    
+    def _read_into(self, filename, out):
+        """
+        Reads one file straight into the (contiguous) slice *out*.
+        """
+        if not os.path.exists(filename):
+            out.fill(self._layout.nodata)
+            return
+        fid = open(filename, 'rb')
+        fid.seek(self._layout.skipbytes)
+        nbytes = fid.readinto(out)
+        fid.close()
+        if nbytes != out.nbytes:
+            raise IOError("%s is smaller than given by its dimensions: %i x %i" %\
+                          (filename, self._layout.nrows, self._layout.ncols))
+        if self._layout.byteorder != ('<' if sys.byteorder == 'little' else '>'):
+            out.byteswap(True)
                 
 if __name__ == "__main__":
     pass
\ No newline at end of file
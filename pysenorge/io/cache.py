@@ -0,0 +1,152 @@
+__docformat__ = "reStructuredText"
+'''
+Process-wide cache of decoded seNorge layers.
+
+Several themes read the same input layers, e.g. *tm* and *sd* are read by
+both depth hoar indices. When the themes run in one process the cache returns
+the array decoded by the first reader. The arrays are read-only, since they
+are shared between all readers.
+
+The cache is disabled by default. Usage::
+
+    from pysenorge.io import cache
+    cache.enable(512) # MB
+    ... run themes ...
+    cache.layer_cache.report()
+
+:Author: kmu
+:Created: 18. okt. 2026
+'''
+# Built-in
+import threading
+from collections import OrderedDict
+
+
+class LayerCache(object):
+    '''
+    Size-bounded, least-recently-used cache of *numpy* arrays.
+
+    Keys are typically (path, mtime, inode, size, dtype), so a file that is
+    rewritten is not served from the cache anymore. Hits, misses and evictions are counted
+    to help choosing the size.
+    '''
+
+    def __init__(self, maxbytes=0, name='Layer cache'):
+        '''
+        Initializes an empty cache.
+
+        :Parameters:
+            - maxbytes: Maximum number of bytes held - 0 disables the cache
+            - name: Shown by *report*
+        '''
+        self.maxbytes = maxbytes
+        self.name = name
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+
+    def enabled(self):
+        """
+        Returns *True* if the cache may hold data.
+        """
+        return self.maxbytes > 0
+
+
+    def get(self, key):
+        """
+        Returns the cached array or *None*.
+        """
+        self._lock.acquire()
+        try:
+            data = self._items.pop(key, None)
+            if data is None:
+                self.misses += 1
+                return None
+            self._items[key] = data # most recently used
+            self.hits += 1
+            return data
+        finally:
+            self._lock.release()
+
+
+    def put(self, key, data):
+        """
+        Adds an array to the cache and evicts the least recently used arrays
+        if the size limit is exceeded. The array is made read-only.
+
+        :Returns: *data*
+        """
+        if data.nbytes > self.maxbytes:
+            return data
+        data.flags.writeable = False
+        self._lock.acquire()
+        try:
+            old = self._items.pop(key, None)
+            if old is not None:
+                self.nbytes -= old.nbytes
+            self._items[key] = data
+            self.nbytes += data.nbytes
+            while self.nbytes > self.maxbytes:
+                oldkey, old = self._items.popitem(last=False)
+                self.nbytes -= old.nbytes
+                self.evictions += 1
+        finally:
+            self._lock.release()
+        return data
+
+
+    def clear(self):
+        """
+        Empties the cache. The statistics are kept.
+        """
+        self._lock.acquire()
+        try:
+            self._items.clear()
+            self.nbytes = 0
+        finally:
+            self._lock.release()
+
+
+    def stats(self):
+        """
+        :Returns: Dictionary with hits, misses, evictions, number of items,
+            bytes used and maximum bytes
+        """
+        return {'hits': self.hits, 'misses': self.misses,
+                'evictions': self.evictions, 'items': len(self._items),
+                'nbytes': self.nbytes, 'maxbytes': self.maxbytes}
+
+
+    def report(self):
+        """
+        Prints the cache statistics to the command line.
+        """
+        print "%s: %i hits, %i misses, %i evictions, %i layers, %.1f of %.1f MB used" %\
+            (self.name, self.hits, self.misses, self.evictions, len(self._items),
+             self.nbytes / 2.0**20, self.maxbytes / 2.0**20)
+
+
+# The cache shared by all readers in this process
+layer_cache = LayerCache()
+
+
+def enable(maxmb=256):
+    """
+    Enables the process-wide layer cache.
+
+    :Parameters:
+        - maxmb: Size limit in MB
+    """
+    layer_cache.maxbytes = int(maxmb * 2**20)
+
+
+def disable():
+    """
+    Disables and empties the process-wide layer cache.
+    """
+    layer_cache.maxbytes = 0
+    layer_cache.clear()
@@ -0,0 +1,266 @@
+__docformat__ = "reStructuredText"
+'''
+Catalog of the forecast, observation and theme files available on disk.
+
+Instead of globbing the network shares and probing paths with
+*os.path.exists*, schedulers and backfills query a SQLite database kept in
+the output tree. For each file it holds the kind, theme, date, time
+coverage, variables, shape, size and modification time.
+
+The catalog is filled by *Catalog.scan*: files are inspected by a pool of
+processes (the netCDF library is not thread-safe) and only new or changed files (size or modification time) are
+opened. Entries of files that disappeared are removed.
+
+Usage::
+
+    cat = Catalog()
+    cat.scan(netCDFin, 'forecast', '*.nc*')
+    cat.scan(BILout, 'theme', '*.bil')
+    for f in cat.find('theme', 'depth_hoar_index_1', start, end):
+        print f['path'], f['date']
+    cat.close()
+
+Command line usage::
+
+    python //~HOME/pysenorge/io/catalog.py KIND DIR [DIR ...] [options]
+
+:Author: kmu
+:Created: 18. okt. 2026
+'''
+# Built-in
+import os, sys, re, time
+import fnmatch
+import sqlite3
+from multiprocessing import Pool
+sys.path.append(os.path.abspath('../..'))
+
+# Own
+from pysenorge.io.bil import read_hdr
+
+# "themename_YYYY_MM_DD.ext" - e.g. sd_2011_02_01.bil, UM4_sf00_2011_02_01.nc
+_name_pattern = re.compile(r'^(.+?)_(\d{4})_(\d{2})_(\d{2})')
+
+_columns = ('path', 'kind', 'theme', 'date', 'format', 'tstart', 'tend',
+            'ntimes', 'variables', 'shape', 'size', 'mtime', 'scanned')
+
+_schema = '''
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    kind TEXT,
+    theme TEXT,
+    date TEXT,
+    format TEXT,
+    tstart REAL,
+    tend REAL,
+    ntimes INTEGER,
+    variables TEXT,
+    shape TEXT,
+    size INTEGER,
+    mtime REAL,
+    scanned REAL
+);
+CREATE INDEX IF NOT EXISTS files_theme_date ON files (theme, date);
+CREATE INDEX IF NOT EXISTS files_kind_date ON files (kind, date);
+'''
+
+
+class Catalog(object):
+    '''
+    SQLite catalog of seNorge input and output files.
+    '''
+
+    def __init__(self, dbfile=None):
+        '''
+        Opens or creates the catalog.
+
+        :Parameters:
+            - dbfile: Path of the SQLite file - default: $BILout/catalog.sqlite
+        '''
+        if dbfile is None:
+            from pysenorge.set_environment import BILout
+            dbfile = os.path.join(BILout, 'catalog.sqlite')
+        self.dbfile = dbfile
+        self.db = sqlite3.connect(dbfile)
+        self.db.row_factory = sqlite3.Row
+        self.db.executescript(_schema)
+
+
+    def scan(self, rootdir, kind, pattern='*', nprocs=4):
+        """
+        Adds new and changed files below *rootdir* and removes entries of
+        files below *rootdir* matching *pattern* that no longer exist.
+
+        :Parameters:
+            - rootdir: Directory searched recursively
+            - kind: "forecast", "observation" or "theme"
+            - pattern: Shell pattern of the file names, e.g. "*.bil"
+            - nprocs: Number of processes inspecting files
+
+        :Returns: Number of added or updated and of removed entries
+        """
+        rootdir = os.path.abspath(rootdir)
+        prefix = os.path.join(rootdir, '')
+        known = {}
+        for row in self.db.execute("SELECT path, size, mtime FROM files "
+                                   "WHERE kind=?", (kind,)):
+            if row['path'].startswith(prefix) and \
+               fnmatch.fnmatch(os.path.basename(row['path']), pattern):
+                known[row['path']] = (row['size'], row['mtime'])
+
+        todo = []
+        found = set()
+        for dirpath, dirnames, filenames in os.walk(rootdir): #@UnusedVariable
+            for name in fnmatch.filter(filenames, pattern):
+                path = os.path.join(dirpath, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                found.add(path)
+                if known.get(path) != (st.st_size, st.st_mtime):
+                    todo.append((path, kind, st.st_size, st.st_mtime))
+
+        # inspect in parallel - the database is only written by this process
+        if nprocs > 1 and len(todo) > 1:
+            pool = Pool(nprocs)
+            try:
+                rows = pool.map(_inspect, todo, chunksize=16)
+            finally:
+                pool.close()
+                pool.join()
+        else:
+            rows = map(_inspect, todo)
+
+        removed = [(path,) for path in known if path not in found]
+        self.db.executemany("INSERT OR REPLACE INTO files VALUES (%s)" %\
+                            ', '.join('?' * len(_columns)), rows)
+        self.db.executemany("DELETE FROM files WHERE path=?", removed)
+        self.db.commit()
+        print "Catalog %s: %i files added or updated, %i removed" %\
+            (self.dbfile, len(rows), len(removed))
+        return len(rows), len(removed)
+
+
+    def find(self, kind=None, theme=None, start=None, end=None):
+        """
+        Returns the catalog entries matching all given criteria, sorted by
+        date.
+
+        :Parameters:
+            - kind: "forecast", "observation" or "theme"
+            - theme: Theme name as given by the file name, e.g. "sd"
+            - start, end: First and last date (*datetime* or "YYYY-MM-DD")
+
+        :Returns: List of dictionaries with the catalog columns
+        """
+        where = []
+        args = []
+        for column, op, value in (('kind', '=', kind), ('theme', '=', theme),
+                                  ('date', '>=', start), ('date', '<=', end)):
+            if value is None:
+                continue
+            if hasattr(value, 'year'):
+                value = value.strftime('%Y-%m-%d')
+            where.append('%s %s ?' % (column, op))
+            args.append(value)
+        sql = "SELECT * FROM files"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += " ORDER BY date, path"
+        return [dict(row) for row in self.db.execute(sql, args)]
+
+
+    def latest(self, kind, theme=None):
+        """
+        Returns the entry with the latest date or *None*.
+        """
+        entries = self.find(kind, theme)
+        if entries:
+            return entries[-1]
+        return None
+
+
+    def close(self):
+        """
+        Closes the database.
+        """
+        self.db.close()
+
+
+def _inspect(item):
+    """
+    Collects the catalog columns of a single file.
+    """
+    path, kind, size, mtime = item
+    name = os.path.basename(path)
+    theme, date = None, None
+    m = _name_pattern.match(name)
+    if m:
+        theme = m.group(1)
+        date = "%s-%s-%s" % m.group(2, 3, 4)
+    ext = name.split('.', 1)[-1].lower() if '.' in name else ''
+
+    tstart = tend = ntimes = None
+    variables = shape = None
+    try:
+        if ext == 'bil':
+            hdrfile = os.path.splitext(path)[0] + '.hdr'
+            if os.path.exists(hdrfile):
+                hdr = read_hdr(hdrfile)
+                shape = "%s,%s" % (hdr.get('NROWS'), hdr.get('NCOLS'))
+                variables = ','.join(hdr.get('BANDNAMES', [theme or '']))
+            else:
+                variables = theme
+        elif ext in ('nc', 'nc.gz'):
+            from pysenorge.io.nc import open_dataset
+            ds = open_dataset(path)
+            try:
+                variables = ','.join(v for v in ds.variables
+                                     if v not in ds.dimensions)
+                dims = [(k, len(d)) for k, d in ds.dimensions.items()
+                        if k != 'time']
+                shape = ','.join("%s=%i" % d for d in dims)
+                if 'time' in ds.variables:
+                    times = ds.variables['time'][:]
+                    ntimes = len(times)
+                    if ntimes:
+                        tstart, tend = float(times.min()), float(times.max())
+            finally:
+                ds.close()
+    except Exception, e:
+        print "Could not inspect %s: %s" % (path, e)
+
+    return (path, kind, theme, date, ext, tstart, tend, ntimes, variables,
+            shape, size, mtime, time.time())
+
+
+def main():
+    '''
+    Scans the given directories into the catalog.
+    '''
+    from optparse import OptionParser
+    usage = "usage: python catalog.py KIND DIR [DIR ...] [options]"
+    parser = OptionParser(usage=usage)
+    parser.add_option("-p", "--pattern",
+                      action="store", dest="pattern", type="string",
+                      default="*", help="File name pattern - default: *")
+    parser.add_option("-c", "--catalog",
+                      action="store", dest="dbfile", type="string",
+                      default=None,
+                      help="Catalog file - default: $BILout/catalog.sqlite")
+    parser.add_option("-n", "--nprocs",
+                      action="store", dest="nprocs", type="int",
+                      default=4, help="Number of processes - default: 4")
+    (options, args) = parser.parse_args()
+
+    if len(args) < 2:
+        parser.error("Please provide the kind and at least one directory!")
+
+    cat = Catalog(options.dbfile)
+    for rootdir in args[1:]:
+        cat.scan(rootdir, args[0], options.pattern, options.nprocs)
+    cat.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,157 @@
+__docformat__ = "reStructuredText"
+'''
+Shared access to the forecast files of one run (UM4 or AROME).
+
+Several themes read the same forecast file, e.g. *wind_10m_daily* and
+*max_wind_speed_daily* both read *x_wind* and *y_wind*. A *ForecastSource*
+opens the file once per process and decodes every requested variable and
+time window once into *float32*, with numpy.nan at fill values. The decoded
+arrays are kept in *forecast_cache* and are read-only.
+
+Only the part of the forecast domain overlapping the seNorge grid needs to
+be read: *crop_window* returns its row and column slices, which are passed
+to *get* and applied to the axes.
+
+The size of the cache is limited; the least recently used arrays are
+dropped first. Hits, misses, evictions and the memory used are shown by
+*forecast_cache.report()*.
+
+Usage::
+
+    fc = forecast_source(ncfile)
+    rows, cols = fc.crop_window()
+    x_wind = fc.get('x_wind', slice(7, 31), rows, cols)
+    rlon, rlat = fc.axis('rlon')[cols], fc.axis('rlat')[rows]
+    forecast_cache.report()
+
+:Author: kmu
+:Created: 18. okt. 2026
+'''
+# Built-in
+import os, sys
+sys.path.append(os.path.abspath('../..'))
+
+# Additional
+from numpy import float32, nan
+from numpy import ma
+
+# Own
+from pysenorge.io.nc import NCreader
+from pysenorge.io.cache import LayerCache
+from pysenorge.grid import crop_window
+
+# Decoded forecast variables of all runs opened in this process
+forecast_cache = LayerCache(maxbytes=512 * 2**20, name='Forecast cache')
+
+# Open sources by absolute file name
+_sources = {}
+
+
+class ForecastSource(object):
+    '''
+    One forecast file, opened once and decoded on demand.
+    '''
+
+    def __init__(self, filename, cache=None):
+        '''
+        :Parameters:
+            - filename: Path of the forecast netCDF file
+            - cache: *LayerCache* for the decoded arrays - default:
+              *forecast_cache*
+        '''
+        self.filename = os.path.abspath(filename)
+        # masked reads: fill values are compared before unpacking
+        self.reader = NCreader(self.filename, masked=True)
+        if cache is None:
+            cache = forecast_cache
+        self.cache = cache
+        self._mtime = os.path.getmtime(self.filename)
+        self._axes = {}
+
+
+    def get(self, name, tndx=None, rows=None, cols=None):
+        """
+        Returns a variable decoded to *float32*, fill values set to
+        numpy.nan. Use *times* and *axis* for the coordinates.
+
+        :Parameters:
+            - name: Variable name, e.g. "x_wind"
+            - tndx: Time index or slice - default: all time steps
+            - rows, cols: Row and column index or slice, e.g. from
+              *crop_window* - default: all
+
+        :Returns: Read-only array
+        """
+        key = (self.filename, self._mtime, name,
+               _hashable(tndx), _hashable(rows), _hashable(cols))
+        data = self.cache.get(key)
+        if data is not None:
+            return data
+
+        data = ma.asarray(self.reader.read(name, tndx, rows, cols))
+        data = data.astype(float32).filled(nan)
+        if self.cache.enabled():
+            self.cache.put(key, data)
+        else:
+            data.flags.writeable = False
+        return data
+
+
+    def axis(self, name):
+        """
+        Returns a coordinate variable, e.g. "rlon", in its stored data-type.
+        It is read once per source.
+        """
+        if name not in self._axes:
+            data = ma.getdata(self.reader.read(name))
+            data.flags.writeable = False
+            self._axes[name] = data
+        return self._axes[name]
+
+
+    def crop_window(self, xname='rlon', yname='rlat'):
+        """
+        Returns the row and column slices of the forecast grid covering the
+        seNorge grid, see *pysenorge.grid.crop_window*.
+        """
+        return crop_window(self.axis(xname), self.axis(yname))
+
+
+    def times(self, tndx=None):
+        """
+        Returns the time values, in seconds since 1970-01-01 00:00:00.
+        """
+        times = ma.getdata(self.reader.times())
+        if tndx is None:
+            return times
+        return times[tndx]
+
+
+    def close(self):
+        """
+        Closes the file and forgets the source. Cached arrays stay valid.
+        """
+        self.reader.close()
+        if _sources.get(self.filename) is self:
+            del _sources[self.filename]
+
+
+def _hashable(index):
+    """
+    Slices are not hashable - use their start, stop and step instead.
+    """
+    if isinstance(index, slice):
+        return ('slice', index.start, index.stop, index.step)
+    return index
+
+
+def forecast_source(filename):
+    """
+    Returns the *ForecastSource* of a file, opening it on first use.
+    """
+    filename = os.path.abspath(filename)
+    source = _sources.get(filename)
+    if source is None:
+        source = ForecastSource(filename)
+        _sources[filename] = source
+    return source
@@ -0,0 +1,165 @@
+__docformat__ = "reStructuredText"
+'''
+Conversion between the integers stored in seNorge files and physical values.
+
+Each layer is stored as integer with a fixed scale, offset and no-data value,
+e.g. the temperature *tm* in 0.1 K. Instead of repeating expressions like
+*float32(tm.data)/10.0 - 273.1* in every theme, the conversion is declared
+once per layer in *layer_codecs*. Decoding gives *float32* values with
+numpy.nan at no-data cells, encoding rounds, clips and sets the no-data value.
+
+Both directions work on blocks of rows, so apart from the result no full-grid
+temporary is allocated.
+
+Usage::
+
+    tm = BILdata(tmfile, 'uint16')
+    tm.read()
+    tm.data = decode(tm.data, 'tm') # degree Celsius
+
+:Author: kmu
+:Created: 18. okt. 2026
+'''
+# Built-in
+import os, sys
+sys.path.append(os.path.abspath('../..'))
+
+# Additional
+from numpy import empty, float32, nan, iinfo, dtype, multiply, add, subtract, \
+                  divide, rint, clip, putmask, isnan, equal
+
+# Own
+from pysenorge.converters import get_FillValue
+
+
+class LayerCodec(object):
+    '''
+    Describes how a layer is stored: *value = raw * scale + offset*.
+    '''
+
+    def __init__(self, datatype, scale=1.0, offset=0.0, unit='', fill=None):
+        '''
+        :Parameters:
+            - datatype: Data-type name of the stored integers, e.g. "uint16"
+            - scale: Factor converting the stored integers to physical units
+            - offset: Added after scaling
+            - unit: Physical unit after decoding
+            - fill: No-data value - default: see *converters.get_FillValue*
+        '''
+        self.datatype = dtype(datatype).type
+        self.scale = scale
+        self.offset = offset
+        self.unit = unit
+        if fill is None:
+            fill = get_FillValue(self.datatype)
+        self.fill = self.datatype(fill)
+
+
+    def decode(self, raw, out=None, chunkrows=64):
+        """
+        Converts stored integers to *float32* physical values, no-data cells
+        become numpy.nan.
+
+        :Parameters:
+            - raw: Integer array as read from file (any view, e.g. a memmap)
+            - out: Optional *float32* array receiving the result
+            - chunkrows: Number of rows converted at a time
+        """
+        if out is None:
+            out = empty(raw.shape, float32)
+        for r0 in xrange(0, raw.shape[0], chunkrows):
+            r = raw[r0:r0+chunkrows]
+            o = out[r0:r0+chunkrows]
+            multiply(r, float32(self.scale), o)
+            if self.offset != 0.0:
+                add(o, float32(self.offset), o)
+            putmask(o, equal(r, self.fill), nan)
+        return out
+
+
+    def encode(self, values, out=None, chunkrows=64):
+        """
+        Converts physical values to the stored integers. Values are rounded
+        and clipped to the range of the data-type, numpy.nan becomes the
+        no-data value.
+
+        :Parameters:
+            - values: Float array (any view)
+            - out: Optional integer array receiving the result
+            - chunkrows: Number of rows converted at a time
+        """
+        if out is None:
+            out = empty(values.shape, self.datatype)
+        # Keep the no-data value out of the valid range
+        info = iinfo(self.datatype)
+        vmin, vmax = info.min, info.max
+        if self.fill == vmax:
+            vmax -= 1
+        elif self.fill == vmin:
+            vmin += 1
+        for r0 in xrange(0, values.shape[0], chunkrows):
+            v = subtract(values[r0:r0+chunkrows], self.offset)
+            divide(v, self.scale, v)
+            rint(v, v)
+            nodata = isnan(v)
+            clip(v, vmin, vmax, v)
+            o = out[r0:r0+chunkrows]
+            o[...] = v
+            putmask(o, nodata, self.fill)
+        return out
+
+
+# Storage of the seNorge layers
+layer_codecs = {
+    'tm': LayerCodec('uint16', 0.1, -273.1, 'C'), # daily mean temperature
+    'sd': LayerCodec('uint16', 0.001, 0.0, 'm'), # snow depth
+    'sdfsw': LayerCodec('uint16', 0.001, 0.0, 'm'), # fresh snow depth
+    'age': LayerCodec('uint8', 1.0, 0.0, 'days'), # snow age
+    'lwc': LayerCodec('uint8', 1.0, 0.0, '%'), # liquid water content
+    'wind_speed_avg_10m': LayerCodec('uint16', 0.1, 0.0, 'm s-1'),
+    'wind_speed_max_10m': LayerCodec('uint16', 0.1, 0.0, 'm s-1'),
+    'wind_speed_avg_600m': LayerCodec('uint16', 0.1, 0.0, 'm s-1'),
+    'wind_speed_max_600m': LayerCodec('uint16', 0.1, 0.0, 'm s-1'),
+    'wind_speed_avg_1500m': LayerCodec('uint16', 0.1, 0.0, 'm s-1'),
+    'wind_speed_max_1500m': LayerCodec('uint16', 0.1, 0.0, 'm s-1'),
+    'depth_hoar_index_1': LayerCodec('int16', 1.0, 0.0, 'K m-1'),
+    'depth_hoar_index_2': LayerCodec('uint16', 1.0, 0.0, 'days'),
+    }
+
+
+def register_layer(name, codec):
+    """
+    Adds or replaces the storage description of a layer.
+
+    :Parameters:
+        - name: Layer name, usually the theme name
+        - codec: *LayerCodec* instance
+    """
+    layer_codecs[name] = codec
+
+
+def decode(raw, layer, out=None):
+    """
+    Converts stored integers of *layer* to *float32* physical values.
+    """
+    return layer_codecs[layer].decode(raw, out)
+
+
+def encode(values, layer, out=None):
+    """
+    Converts physical values of *layer* to the stored integers.
+    """
+    return layer_codecs[layer].encode(values, out)
+
+
+def read_layer(filename, layer):
+    """
+    Reads a BIL file and decodes it straight from the mapped file.
+
+    :Returns: *float32* array with physical values and numpy.nan as no-data
+    """
+    from pysenorge.io.bil import BILdata
+    codec = layer_codecs[layer]
+    bd = BILdata(filename, dtype(codec.datatype).name)
+    bd.read(mmap=True)
+    return codec.decode(bd.data)
@@ -28,13 +28,14 @@ netCDF fil standard for seNorge
 '''
 # Built-in
 import os, sys, time
+import gzip, shutil, tempfile, hashlib
 sys.path.append(os.path.abspath('../..'))
 
 # Additional
-from numpy import arange, float32
+from numpy import arange, float32, dtype
 
 try:
-    from netCDF4 import Dataset, num2date
+    from netCDF4 import Dataset, num2date, date2num
     print "Using netCDF4"
 except ImportError:
     try:
@@ -49,19 +50,231 @@ from pysenorge.set_environment import timeunit, default_senorge_width,\
             default_senorge_height
 from pysenorge.converters import get_FillValue
 from pysenorge.grid import senorge_grid
+from pysenorge.tools.date_converters import get_hydroyear
+
+# Output profiles - storage settings chosen by the main access pattern.
+#   format: netCDF file format
+#   zlib, complevel, shuffle: compression of all variables
+#   chunks: chunk length per dimension name, limited to the dimension size
+#   lsd: default least significant digit of floating point themes
+#   coord_zlib: compress the coordinate variables
+nc_profiles = {
+    # whole maps are read, e.g. by the map server: one chunk per time step
+    'web-map': {'format': 'NETCDF4', 'zlib': True, 'complevel': 4,
+                'shuffle': True, 'chunks': {'time': 1, 'y': 1550, 'x': 1195},
+                'lsd': None, 'coord_zlib': True},
+    # season files appended to daily and read at points or small areas:
+    # one time step per chunk, so a daily append writes only its own chunks,
+    # and small tiles, so a point series decompresses little per day
+    'time-series': {'format': 'NETCDF4', 'zlib': True, 'complevel': 4,
+                    'shuffle': True,
+                    'chunks': {'time': 1, 'y': 100, 'x': 100},
+                    'lsd': None, 'coord_zlib': True},
+    # long term storage: maximum compression, reduced precision
+    'archive': {'format': 'NETCDF4', 'zlib': True, 'complevel': 9,
+                'shuffle': True, 'chunks': {'time': 1, 'y': 310, 'x': 239},
+                'lsd': 2, 'coord_zlib': True},
+    }
+
+
+# How gzipped files (*.nc.gz) are opened: "memory" decompresses into memory,
+# "tempfile" into a file in gz_cachedir. The cache directory is limited to
+# gz_cache_maxbytes, the least recently used files are removed first.
+gz_mode = 'memory'
+gz_cachedir = os.path.join(tempfile.gettempdir(), 'pysenorge_nc')
+gz_cache_maxbytes = 4 * 2**30
+
+
+def netcdf_path(filename):
+    """
+    Returns *filename*, or *filename.gz* if only the gzipped file exists.
+    """
+    if not os.path.exists(filename) and os.path.exists(filename + '.gz'):
+        return filename + '.gz'
+    return filename
+
+
+def open_dataset(filename):
+    """
+    Opens a netCDF file for reading. Gzipped files are decompressed to
+    memory or to the temporary file cache, see *gz_mode*; they are never
+    extracted next to the original.
+    
+    :Returns: netCDF4 *Dataset*
+    """
+    if not filename.endswith('.gz'):
+        return Dataset(filename, 'r')
+    if gz_mode == 'memory':
+        fid = gzip.open(filename, 'rb')
+        try:
+            buf = fid.read()
+        finally:
+            fid.close()
+        try:
+            return Dataset(filename[:-3], 'r', memory=buf)
+        except (TypeError, ValueError, IOError):
+            # netCDF library without in-memory support
+            del buf
+    return Dataset(_gz_tempfile(filename), 'r')
+
+
+def _gz_tempfile(filename):
+    """
+    Returns the decompressed copy of *filename* in the cache directory,
+    creating it if necessary.
+    """
+    if not os.path.exists(gz_cachedir):
+        try:
+            os.makedirs(gz_cachedir)
+        except OSError:
+            pass # created by another process
+    st = os.stat(filename)
+    key = hashlib.md5("%s %i %f" % (os.path.abspath(filename), st.st_size,
+                                    st.st_mtime)).hexdigest()[:12]
+    name = os.path.basename(filename)[:-3]
+    cached = os.path.join(gz_cachedir, "%s_%s" % (key, name))
+    if os.path.exists(cached):
+        os.utime(cached, None) # mark as recently used
+        return cached
+    
+    _gz_evict(st.st_size * 4)
+    fd, tmpname = tempfile.mkstemp(dir=gz_cachedir)
+    fout = os.fdopen(fd, 'wb')
+    fin = gzip.open(filename, 'rb')
+    try:
+        try:
+            shutil.copyfileobj(fin, fout, 2**20)
+        finally:
+            fin.close()
+            fout.close()
+    except:
+        os.remove(tmpname)
+        raise
+    if sys.platform == 'win32' and os.path.exists(cached):
+        os.remove(tmpname)
+    else:
+        os.rename(tmpname, cached)
+    return cached
+
+
+def _gz_evict(needed):
+    """
+    Removes the least recently used files from the cache directory until
+    *needed* bytes fit into *gz_cache_maxbytes*.
+    """
+    files = []
+    for name in os.listdir(gz_cachedir):
+        path = os.path.join(gz_cachedir, name)
+        try:
+            st = os.stat(path)
+        except OSError:
+            continue
+        files.append((st.st_atime, st.st_size, path))
+    files.sort()
+    total = sum(f[1] for f in files)
+    for atime, size, path in files: #@UnusedVariable
+        if total + needed <= gz_cache_maxbytes:
+            break
+        try:
+            os.remove(path)
+            total -= size
+        except OSError:
+            pass # in use on win32 or removed by another process
+
+
+def register_profile(name, **settings):
+    """
+    Adds or replaces an output profile. Missing settings are taken from the
+    "web-map" profile.
+    
+    :Parameters:
+        - name: Name of the profile
+        - settings: See *nc_profiles*
+    """
+    profile = dict(nc_profiles['web-map'])
+    profile.update(settings)
+    nc_profiles[name] = profile
+
 
 class NCdata():
     """
     Class for reading, writing and displaying netCDF formated files for seNorge.no.
     """
     
-    def __init__(self, filename):
+    def __init__(self, filename, profile=None):
+        """
+        :Parameters:
+            - filename: Path of the netCDF file
+            - profile: Name of an output profile in *nc_profiles* - default:
+              NETCDF3_CLASSIC without chunking, compression set by *zip*
+        
+        Set *latlon* to *False* to store only the x, y axes and the
+        UTM_Projection grid mapping instead of 2-D longitude and latitude.
+        *geometry_file* may then name a file written by *new_geometry* that
+        holds lon and lat for all files.
+        """
         self.filename = filename
         
         self.default_senorge_time = 1
         
         self.zip = False
         
+        self.latlon = True
+        self.geometry_file = None
+        
+        # coordinate values are written after all variables are defined
+        self._pending = []
+        
+        if profile is not None and profile not in nc_profiles:
+            raise ValueError("Unknown netCDF profile %s" % profile)
+        self.profile = profile
+        
+    
+    def _file_format(self):
+        if self.profile is None:
+            return 'NETCDF3_CLASSIC'
+        return nc_profiles[self.profile]['format']
+    
+    
+    def _storage(self, dimensions, vartype=None, lsd=None, coordinate=False):
+        """
+        Returns the storage keywords of *createVariable* for a new variable.
+        
+        :Parameters:
+            - dimensions: Tuple of dimension names
+            - vartype: Data-type of the variable, used to decide on *lsd*
+            - lsd: Least significant digit, overrides the profile default
+            - coordinate: *True* for coordinate variables
+        """
+        if self.profile is None:
+            kwargs = {'zlib': self.zip}
+            if lsd is not None:
+                kwargs['least_significant_digit'] = lsd
+            return kwargs
+        
+        profile = nc_profiles[self.profile]
+        if coordinate:
+            kwargs = {'zlib': profile['coord_zlib']}
+        else:
+            kwargs = {'zlib': profile['zlib'], 'shuffle': profile['shuffle']}
+            if lsd is None:
+                lsd = profile['lsd']
+            if lsd is not None and vartype is not None and \
+                    dtype(vartype).kind == 'f':
+                kwargs['least_significant_digit'] = lsd
+        if kwargs['zlib']:
+            kwargs['complevel'] = profile['complevel']
+        if profile['format'].startswith('NETCDF4') and dimensions:
+            chunks = []
+            for name in dimensions:
+                dim = self.rootgrp.dimensions[name]
+                size = profile['chunks'].get(name, len(dim))
+                if not dim.isunlimited():
+                    size = min(size, len(dim))
+                chunks.append(max(size, 1))
+            kwargs['chunksizes'] = tuple(chunks)
+        return kwargs
+    
     
     def new(self, secs):
         """
@@ -71,17 +284,61 @@ class NCdata():
         :Parameters:
             - secs: in seconds since 1970-01-01 00:00:00
         """
+        self._create(('time',))
+        
+        # add coordinates
+        try:
+            times = self.rootgrp.createVariable('time', 'f8', ('time',),
+                        **self._storage(('time',), coordinate=True))
+        except TypeError:
+            times = self.rootgrp.createVariable('time', 'f', ('time',))
+        times.units = 'seconds since 1970-01-01 00:00:00 +00:00'
+        times.long_name = 'time'
+        times.standard_name = 'time'
+        times.axis = 'T'
+        times.calendar = 'standard'
+        self._pending.append((times, secs))
+        
+        self._set_utm()
+        if self.latlon:
+            self._set_latlon()
+        elif self.geometry_file is not None:
+            self.rootgrp.external_variables = "lon lat"
+            self.rootgrp.geometry_file = self.geometry_file
+        
+        
+    def new_geometry(self):
+        """
+        Creates a file holding only the seNorge geometry: x, y, lon, lat and
+        the grid mapping. Daily files written with *latlon = False* can refer
+        to it by *geometry_file*.
+        """
+        self._create(())
+        self.rootgrp.comment = "Geometry of the seNorge grid"
+        self._set_utm()
+        self._set_latlon()
+        
+        
+    def _create(self, dimensions):
+        """
+        Creates the file with the root attributes and the y, x dimensions.
+        
+        :Parameters:
+            - dimensions: Further dimensions - only "time" is supported
+        """
         # create new file
         try:
-            rootgrp = Dataset(self.filename, 'w', format='NETCDF3_CLASSIC')
+            rootgrp = Dataset(self.filename, 'w', format=self._file_format())
             # add root dimensions
-            rootgrp.createDimension('time', size=self.default_senorge_time)
+            if 'time' in dimensions:
+                rootgrp.createDimension('time', size=self.default_senorge_time)
             rootgrp.createDimension('x', size=default_senorge_width)
             rootgrp.createDimension('y', size=default_senorge_height)
         except TypeError:
             rootgrp = Dataset(self.filename, 'w')
             # add root dimensions
-            rootgrp.createDimension('time', self.default_senorge_time)
+            if 'time' in dimensions:
+                rootgrp.createDimension('time', self.default_senorge_time)
             rootgrp.createDimension('x', default_senorge_width)
             rootgrp.createDimension('y', default_senorge_height)
         
@@ -94,21 +351,7 @@ class NCdata():
         rootgrp.comment = "Data distributed via www.senorge.no"
         
         self.rootgrp = rootgrp
-        
-        # add coordinates
-        try:
-            times = self.rootgrp.createVariable('time', 'f8', ('time',))
-        except TypeError:
-            times = self.rootgrp.createVariable('time', 'f', ('time',))
-        times.units = 'seconds since 1970-01-01 00:00:00 +00:00'
-        times.long_name = 'time'
-        times.standard_name = 'time'
-        times.axis = 'T'
-        times.calendar = 'standard'
-        times[:] = secs
-        
-        self._set_utm()
-        self._set_latlon()
+        self._pending = []
         
         
     def add_variable(self, theme_name, theme_dtype, theme_unit, long_name, data,
@@ -124,18 +367,76 @@ class NCdata():
             - data: The input data to be stored.
             - lsd: Least significant digit to be stored.      
         """
-        var = self.rootgrp.createVariable(theme_name, theme_dtype,
-                                          ('time', 'y', 'x'),
-                                          fill_value=get_FillValue(data.dtype),
-                                          zlib=self.zip, # reduces disk space enormously 
-                                          least_significant_digit=lsd
-                                          )
+        var = self._define(self.rootgrp, theme_name, theme_dtype, theme_unit,
+                           long_name, get_FillValue(data.dtype), lsd)
+        self._write(var, data)
+            
+        print """Added variable "%s" to file %s""" % (theme_name, self.filename)
+        
+        
+    def add_variables(self, variables):
+        """
+        Defines several variables at once and writes their data afterwards.
+        
+        All variables, and the coordinates of *new*, are defined before the
+        first value is written, so a NETCDF3 header is written only once.
+        
+        :Parameters:
+            - variables: Sequence of tuples (theme_name, theme_dtype,
+              theme_unit, long_name, data[, lsd]) - see *add_variable*
+        """
+        defined = []
+        for item in variables:
+            theme_name, theme_dtype, theme_unit, long_name, data = item[:5]
+            lsd = None
+            if len(item) > 5:
+                lsd = item[5]
+            var = self._define(self.rootgrp, theme_name, theme_dtype,
+                               theme_unit, long_name,
+                               get_FillValue(data.dtype), lsd)
+            defined.append((theme_name, var, data))
+        
+        for theme_name, var, data in defined:
+            self._write(var, data)
+            print """Added variable "%s" to file %s""" % (theme_name,
+                                                          self.filename)
+        
+        
+    def _flush(self):
+        """
+        Writes the pending coordinate values.
+        """
+        pending, self._pending = self._pending, []
+        for var, values in pending:
+            var[:] = values
+        
+        
+    def _define(self, grp, theme_name, theme_dtype, theme_unit, long_name,
+                fill_value, lsd=None):
+        """
+        Creates a (time, y, x) variable with the default attributes in *grp*.
+        """
+        dims = ('time', 'y', 'x')
+        var = grp.createVariable(theme_name, theme_dtype, dims,
+                                 fill_value=fill_value,
+                                 **self._storage(dims, theme_dtype, lsd)
+                                 )
         
         # set default attributes
         var.units = theme_unit
         var.long_name = long_name
         var._CoordinateSystems = "UTM_Projection"
-        
+        var.grid_mapping = "UTM_Projection"
+        if self.latlon:
+            var.coordinates = "lon lat"
+        return var
+    
+    
+    def _write(self, var, data):
+        """
+        Writes a seNorge map to *var*.
+        """
+        self._flush()
         # Check for correct dimensions
         if data.shape == (1550, 1195):
             var[:] = data
@@ -145,15 +446,16 @@ class NCdata():
         else:
             print "Data array does not have seNorge standard dimensions: (y=1550, x=1195)."
             self.close()
-            
-        print """Added variable "%s" to file %s""" % (theme_name, self.filename)
         
         
     def close(self):
         """
         Closes and flushes the netCDF file.
         """
-        self.rootgrp.close()
+        try:
+            self._flush()
+        finally:
+            self.rootgrp.close()
 
     
     def report(self):
@@ -171,23 +473,23 @@ class NCdata():
         
         try:
             lon = self.rootgrp.createVariable('lon', 'f4', ('y','x'),
-                                              zlib=self.zip)
+                        **self._storage(('y','x'), coordinate=True))
         except TypeError:
             lon = self.rootgrp.createVariable('lon', 'f', ('y','x'))
         lon.units = 'degrees_east'
         lon.long_name = 'longitude'
         lon.standard_name = 'longitude'
-        lon[:] = float32(longrid)
+        self._pending.append((lon, float32(longrid)))
         
         try:
             lat = self.rootgrp.createVariable('lat', 'f4', ('y','x'),
-                                              zlib=self.zip)
+                        **self._storage(('y','x'), coordinate=True))
         except TypeError:
             lat = self.rootgrp.createVariable('lat', 'f', ('y','x'))
         lat.units = 'degrees_north'
         lat.long_name = 'latitude'
         lat.standard_name = 'latitude'
-        lat[:] = float32(latgrid)
+        self._pending.append((lat, float32(latgrid)))
         
         
     def _set_utm(self):
@@ -211,21 +513,25 @@ class NCdata():
         utm = self.rootgrp.createVariable('UTM_Projection', 'c', ())
         utm.units = 'meters'
         utm.long_name = 'Universal Transverse Mercator Projection, Zone 33'
-        utm.grid_mapping_name = "UTM"
+        utm.grid_mapping_name = "transverse_mercator"
         utm.scale_factor_at_central_meridian = 0.9996
         utm.latitude_of_projection_origin = 0
         utm.false_easting = 500000
+        utm.false_northing = 0
         utm.utm_zone_number = 33
         utm.longitude_of_central_meridian = 15.0
         utm.semimajor_axis = 6378137.0
+        utm.semi_major_axis = 6378137.0
         utm.semi_minor_axis = 6356752.3142
+        utm.inverse_flattening = 298.257223563
         utm.proj4 = "+proj=utm +zone=33 +ellps=WGS84"
         utm._CoordinateTransformType = "Projection"
         utm._CoordinateAxes = "y x"
         utm._CoordinateAxisTypes = "GeoX GeoY"    
         
         try: 
-            x = self.rootgrp.createVariable('x', 'f4', ('x',), zlib=self.zip)
+            x = self.rootgrp.createVariable('x', 'f4', ('x',),
+                        **self._storage(('x',), coordinate=True))
         except TypeError:
             x = self.rootgrp.createVariable('x', 'f', ('x',))
         x.axis = 'X'
@@ -235,7 +541,8 @@ class NCdata():
         x._CoordinateAxisType = "GeoX"
         
         try:
-            y = self.rootgrp.createVariable('y', 'f4', ('y',), zlib=self.zip)
+            y = self.rootgrp.createVariable('y', 'f4', ('y',),
+                        **self._storage(('y',), coordinate=True))
         except TypeError:
             y = self.rootgrp.createVariable('y', 'f', ('y',))
         y.axis = 'Y'
@@ -244,10 +551,236 @@ class NCdata():
         y.standard_name = 'projection_y_coordinate'
         y._CoordinateAxisType = "GeoY"
         
-        x[:] = arange(LowerLeftEast, UpperRightEast, dx, dtype=float32)
-        y[:] = arange(LowerLeftNorth, UpperRightNorth, dy, dtype=float32)
+        self._pending.append((x, arange(LowerLeftEast, UpperRightEast, dx,
+                                        dtype=float32)))
+        self._pending.append((y, arange(LowerLeftNorth, UpperRightNorth, dy,
+                                        dtype=float32)))
 
 
+class NCseries(NCdata):
+    """
+    One file per theme and hydrological year with an unlimited time dimension.
+    
+    Daily runs add their map with *put*, which appends a new time step or
+    overwrites the one of the same date. Readers access a single date with
+    *get* or the whole season at a grid cell with *point*. The default
+    "time-series" profile stores small tiles of a single day, so appending a
+    day never rewrites chunks of earlier days.
+    
+    Usage::
+    
+        ncfile = NCseries(season_filename(outdir, themedir, cdt))
+        ncfile.open()
+        ncfile.put(secs, themedir, 'u2', 'cm', themename, data)
+        ncfile.close()
+    """
+    
+    def __init__(self, filename, profile='time-series'):
+        NCdata.__init__(self, filename, profile)
+        # unlimited time dimension
+        self.default_senorge_time = None
+        self._times = {}
+        
+    
+    def open(self):
+        """
+        Opens the file for appending or creates it if it does not exist.
+        The time index is read once.
+        """
+        if os.path.exists(self.filename):
+            self.rootgrp = Dataset(self.filename, 'a')
+        else:
+            self.new([])
+            self._flush()
+        times = self.rootgrp.variables['time'][:]
+        self._times = dict((float(t), i) for i, t in enumerate(times))
+        
+        
+    def index(self, secs):
+        """
+        Returns the time index of *secs* or *None* if the date is not stored.
+        """
+        return self._times.get(float(secs))
+        
+        
+    def put(self, secs, theme_name, theme_dtype, theme_unit, long_name, data,
+            lsd=None):
+        """
+        Writes the map of one date. The variable is created on first use.
+        
+        :Parameters:
+            - secs: Date in seconds since 1970-01-01 00:00:00
+            - data: Map with seNorge standard dimensions (y=1550, x=1195)
+            - see *NCdata.add_variable* for the other parameters
+        
+        :Returns: The time index written to
+        """
+        if data.shape != (default_senorge_height, default_senorge_width):
+            raise ValueError("Data array does not have seNorge standard dimensions: (y=1550, x=1195).")
+        if theme_name in self.rootgrp.variables:
+            var = self.rootgrp.variables[theme_name]
+        else:
+            var = self._define(self.rootgrp, theme_name, theme_dtype,
+                               theme_unit, long_name,
+                               get_FillValue(data.dtype), lsd)
+        
+        ndx = self.index(secs)
+        if ndx is None:
+            ndx = len(self._times)
+            self.rootgrp.variables['time'][ndx] = secs
+            self._times[float(secs)] = ndx
+        var[ndx] = data
+        return ndx
+        
+        
+    def get(self, theme_name, secs):
+        """
+        :Returns: The map of the given date
+        """
+        ndx = self.index(secs)
+        if ndx is None:
+            raise KeyError("No data for %s at %s" % (theme_name, secs))
+        return self.rootgrp.variables[theme_name][ndx]
+        
+        
+    def point(self, theme_name, row, col):
+        """
+        Returns the season at one grid cell.
+        
+        :Parameters:
+            - row, col: Indices in netCDF orientation (first row is south)
+        
+        :Returns: times, values - sorted by time
+        """
+        times = self.rootgrp.variables['time'][:]
+        values = self.rootgrp.variables[theme_name][:, row, col]
+        order = times.argsort()
+        return times[order], values[order]
+
+
+def season_filename(outdir, theme_name, date):
+    """
+    Returns the path of the season file of a theme, e.g.
+    *outdir/depth_hoar_index_1_2011.nc* for the hydrological year 2011.
+    
+    :Parameters:
+        - outdir: Output directory of the theme
+        - theme_name: Short theme name
+        - date: *datetime* within the hydrological year
+    """
+    return os.path.join(outdir, "%s_%i.nc" % (theme_name, get_hydroyear(date)))
+
+
+class NCreader(object):
+    """
+    Read access to seNorge theme files and AROME/UM4 forecast files. Gzipped
+    files are read without extracting them, see *open_dataset*.
+    
+    The file is opened once and kept open until *close* is called.
+    Variables are returned as lazy netCDF variables, data is only read for
+    the requested time steps, rows and columns. By default the values are
+    returned as plain *numpy* arrays without masking.
+    
+    Usage::
+    
+        nc = NCreader(ncfile)
+        tndx = nc.time_index(cdt)
+        sd = nc.read('sd', tndx, rows=slice(100, 200))
+        nc.close()
+    """
+    
+    def __init__(self, filename, masked=False, timename='time'):
+        """
+        :Parameters:
+            - filename: Path of the netCDF file
+            - masked: If *True* variables are returned as masked arrays
+            - timename: Name of the time variable
+        """
+        self.filename = filename
+        self.rootgrp = open_dataset(filename)
+        if not masked:
+            try:
+                self.rootgrp.set_auto_mask(False)
+            except AttributeError:
+                pass # older netCDF4 - arrays stay masked
+        self.timename = timename
+        self._times = None
+        self._tindex = None
+        
+        
+    def __getitem__(self, name):
+        """
+        Returns the lazy variable *name*; slicing it reads from the file.
+        """
+        return self.rootgrp.variables[name]
+    
+    
+    def __contains__(self, name):
+        return name in self.rootgrp.variables
+    
+    
+    def times(self):
+        """
+        Returns the values of the time variable, read once.
+        """
+        if self._times is None:
+            self._times = self.rootgrp.variables[self.timename][:]
+            self._tindex = dict((float(t), i) for i, t in enumerate(self._times))
+        return self._times
+    
+    
+    def dates(self):
+        """
+        Returns the time steps as *datetime* objects.
+        """
+        timevar = self.rootgrp.variables[self.timename]
+        return num2date(self.times(), getattr(timevar, 'units', timeunit))
+    
+    
+    def time_index(self, date):
+        """
+        Returns the index of a time step.
+        
+        :Parameters:
+            - date: *datetime* or value of the time variable
+        """
+        self.times()
+        if hasattr(date, 'year'):
+            timevar = self.rootgrp.variables[self.timename]
+            date = date2num(date, getattr(timevar, 'units', timeunit))
+        try:
+            return self._tindex[float(date)]
+        except KeyError:
+            raise KeyError("%s not found in %s" % (date, self.filename))
+    
+    
+    def read(self, name, tndx=None, rows=None, cols=None):
+        """
+        Reads a hyperslab of a (time, y, x) or (y, x) variable.
+        
+        :Parameters:
+            - name: Variable name
+            - tndx: Time index, slice or *datetime* - default: all time steps
+            - rows, cols: Row and column index or slice - default: all
+        """
+        var = self.rootgrp.variables[name]
+        if hasattr(tndx, 'year'):
+            tndx = self.time_index(tndx)
+        window = []
+        if var.dimensions and var.dimensions[0] == self.timename:
+            window.append(slice(None) if tndx is None else tndx)
+        window.append(slice(None) if rows is None else rows)
+        window.append(slice(None) if cols is None else cols)
+        return var[tuple(window[:len(var.dimensions)])]
+    
+    
+    def close(self):
+        """
+        Closes the netCDF file.
+        """
+        self.rootgrp.close()
+        
+        
 #class UM4Dataset(Dataset):
 #    """
 #    Class for reading, writing and displaying netCDF format files from met.no's 
@@ -341,61 +874,96 @@ class NCdata():
 
 class NCdataGrp(NCdata):
     '''
-    UNDER CONSTRUCTION
-    
-    Collection of functions for reading, writing and displaying data stored in
-    netCDF format version 4 supporting groups.
-    
+    Daily bundle in netCDF format version 4 holding all layers of one day.
     
     The netCDF file contains three groups:
         - forecasts
         - observations
         - themes
-        
+    
+    The time, x, y (and lon, lat) coordinates and the grid mapping are
+    written once to the root group and shared by the variables of all groups.
+    A multi-theme run creates the file once with *new*, adds all its layers
+    and closes it.
+    
+    Usage::
+    
+        ncfile = NCdataGrp(os.path.join(outdir, 'senorge_2011_02_01.nc'))
+        ncfile.new(secs)
+        ncfile.add_observation('tm', 'f4', 'C', 'Temperature', tm)
+        ncfile.add_theme('depth_hoar_index_1', 'i2', 'K m-1', themename, tgss)
+        ncfile.close()
+    
     @warning: I{Groups} are a new feature in version 4. software based on
     version 3 will not be able to read these files. 
     '''
+    
+    def __init__(self, filename, profile='web-map'):
+        NCdata.__init__(self, filename, profile)
+        if profile is None or nc_profiles[profile]['format'] != 'NETCDF4':
+            raise ValueError("Groups require a NETCDF4 profile")
         
-    def new(self):
-        # create new file
-        rootgrp = Dataset(self.filename, 'w', format='NETCDF4')
+        
+    def new(self, secs):
+        """
+        Creates the file with the shared coordinates and the three groups.
+        
+        :Parameters:
+            - secs: in seconds since 1970-01-01 00:00:00
+        """
+        NCdata.new(self, secs)
         # create standard groups
-        fcstgrp = rootgrp.createGroup('forecasts')
-        obsgrp = rootgrp.createGroup('observations')
-        thmgrp = rootgrp.createGroup('themes')
+        fcstgrp = self.rootgrp.createGroup('forecasts')
+        obsgrp = self.rootgrp.createGroup('observations')
+        thmgrp = self.rootgrp.createGroup('themes')
         # add group attributes
         fcstgrp.long_name = 'weather_forecast'
         obsgrp.long_name = 'interpolated_observations'
         thmgrp.long_name = 'senorge_theme_layers'
         
-        
-        self.rootgrp = rootgrp
         self.fcstgrp = fcstgrp
         self.obsgrp = obsgrp
         self.thmgrp = thmgrp
         
         
-    #Should there be a read and add function or just a general open function?
-#    def open(self):
-#        rootgrp = Dataset(self.filename, 'a')
+    def add_forecast(self, name, dtype, unit, long_name, data, lsd=None):
+        """
+        Adds a forecast layer, see *NCdata.add_variable*.
+        """
+        self._add(self.fcstgrp, name, dtype, unit, long_name, data, lsd)
         
-    def add_forecast(self):
-        pass
         
-    def add_observation(self):
-        pass
+    def add_observation(self, name, dtype, unit, long_name, data, lsd=None):
+        """
+        Adds an observed layer, see *NCdata.add_variable*.
+        """
+        self._add(self.obsgrp, name, dtype, unit, long_name, data, lsd)
         
-    def add_theme(self, theme_name, theme_dtype, theme_unit ):
-        self.rootgrp = Dataset(self.filename, 'a') # might be replaced by open or add function
-        self.rootgrp.thmgrp.createDimension(theme_name, size=self.default_theme_dimension)
-        new_theme = self.rootgrp.thmgrp.createVariable(theme_name, theme_dtype, (theme_name,)) # check how the dimensions work for 2D!!!
-        # set default attributes
-        new_theme.units = theme_unit
-        new_theme._FillValue = -32767.0 # make changeable and dependent on dtype
+        
+    def add_theme(self, theme_name, theme_dtype, theme_unit, long_name, data,
+                  lsd=None):
+        """
+        Adds a theme layer, see *NCdata.add_variable*.
+        """
+        self._add(self.thmgrp, theme_name, theme_dtype, theme_unit,
+                  long_name, data, lsd)
+        
+        
+    def _add(self, grp, name, dtype, unit, long_name, data, lsd):
+        var = self._define(grp, name, dtype, unit, long_name,
+                           get_FillValue(data.dtype), lsd)
+        self._write(var, data)
+        print """Added variable "%s/%s" to file %s""" % (grp.name, name,
+                                                         self.filename)
         
         
     def report(self):
-        print self.rootgrp.groups
+        """
+        Writes the groups and their variables to the command line.
+        """
+        print "File: %s" % self.filename
+        for name, grp in self.rootgrp.groups.items():
+            print "\t%s: %s" % (name, ", ".join(grp.variables.keys()))
         
         
 def NCreport(NCfile, stdout=False):
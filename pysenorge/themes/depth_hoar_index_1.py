@@ -34,7 +34,7 @@ from datetime import timedelta
 execfile(os.path.join(os.path.dirname(__file__), "set_pysenorge_path.py"))
 
 # Additional
-from numpy import flipud, zeros_like, int16, float32
+from numpy import flipud, zeros_like
 try: # for future purpose
     from netCDF4 import date2num
 except ImportError:
@@ -43,9 +43,10 @@ except ImportError:
 from pysenorge.set_environment import METdir, PROGdir, BILin, BILout, \
                                         IntFillValue, timeunit
 from pysenorge.io.bil import BILdata
+from pysenorge.io.layers import decode, encode
 from pysenorge.tools.date_converters import datetime2BILdate, iso2datetime,\
                                             get_hydroyear
-from pysenorge.grid import senorge_mask
+from pysenorge.grid import land_mask
 
 
 def model(tm, sd, tgss):
@@ -71,7 +72,7 @@ def model(tm, sd, tgss):
     sddims = sd.shape
     if tmdims != sddims:
         print "Temperature grid and snow-depth grid have different shapes!"
-    if tgss == None:
+    if tgss is None:
         tgss = zeros_like(tm)
     for i in range(tmdims[0]):
         for j in range(tmdims[1]):
@@ -95,7 +96,7 @@ def __model(tm, sd, tgss):
     sddims = sd.shape
     if tmdims != sddims:
         print "Temperature grid and snow-depth grid have different shapes!"
-    if tgss == None:
+    if tgss is None:
         tgss = zeros_like(tm)
     
     
@@ -121,7 +122,8 @@ def __model(tm, sd, tgss):
     tgss[littlesnow] = littlesnow_flag
     tgss[nosnow] = nosnow_flag
     
-    return int16(tgss)
+    # round to int16, numpy.nan (missing input) becomes the fill value
+    return encode(tgss, 'depth_hoar_index_1')
 
 def main():
     '''
@@ -191,12 +193,12 @@ def main():
         tm = BILdata(tmfile, 'uint16')
         tm.read()
         # convert to Celsius
-        tm.data = (float32(tm.data) / 10.0) - 273.1
+        tm.data = decode(tm.data, 'tm')
         # Load yesterdays data 
         sd = BILdata(sdfile, 'uint16')
         sd.read()
         # convert mm to m 
-        sd.data = float32(sd.data) / 1000.0  
+        sd.data = decode(sd.data, 'sd')  
         
     if not os.path.exists(tgssfile):
         print "Yesterdays TGSS data does not exist - using None!"
@@ -205,7 +207,8 @@ def main():
         # Load todays data
         tgss = BILdata(tgssfile, 'int16')
         tgss.read()
-        tgss.data = float32(tgss.data)
+        # fill values become numpy.nan
+        tgss.data = decode(tgss.data, 'depth_hoar_index_1')
         
     # Setup outputs
     outfile = themedir+'_'+datetime2BILdate(cdt)
@@ -223,8 +226,7 @@ def main():
 #    tgss = int16(model(tm.data, sd.data, tgss.data))
     tgss = __model(tm.data, sd.data, tgss.data)
     # Set no-data values to IntFillValue
-    mask = senorge_mask()
-    tgss[mask] = IntFillValue
+    land_mask().fill(tgss, IntFillValue)
     
     if options.bil:
         # Write to BIL file
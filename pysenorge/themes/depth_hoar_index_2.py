@@ -42,9 +42,10 @@ except ImportError:
 from pysenorge.set_environment import METdir, PROGdir, BILin, BILout, \
                                         UintFillValue, timeunit
 from pysenorge.io.bil import BILdata
+from pysenorge.io.layers import decode
 from pysenorge.tools.date_converters import datetime2BILdate, iso2datetime,\
                                             get_hydroyear
-from pysenorge.grid import senorge_mask
+from pysenorge.grid import land_mask
 
 
 def model(tm, sd, tds):
@@ -60,7 +61,7 @@ def model(tm, sd, tds):
     littlesnow_flag = 65533
     nosnow_flag = 65534
     
-    if tds == None: # init tds if not existent
+    if tds is None: # init tds if not existent
         tds = uint16(zeros_like(tm))
     
     # define the array masks
@@ -113,7 +114,7 @@ def main():
                   help="Set to suppress output in BIL format")
     parser.add_option("--nc",
                   action="store_true", dest="nc", default=False,
-                  help="Set to store output in netCDF format")
+                  help="Set to add output to the netCDF season file")
     parser.add_option("--png",
                   action="store_true", dest="png", default=False,
                   help="Set to store output as PNG image")
@@ -155,12 +156,12 @@ def main():
         tm = BILdata(tmfile, 'uint16')
         tm.read()
         # convert to Celsius
-        tm.data = (float32(tm.data) / 10.0) - 273.1
+        tm.data = decode(tm.data, 'tm')
         # Load yesterdays data 
         sd = BILdata(sdfile, 'uint16')
         sd.read()
         # convert mm to m 
-        sd.data = float32(sd.data) / 1000.0  
+        sd.data = decode(sd.data, 'sd')  
         
     if not os.path.exists(tdsfile):
         print "Yesterdays TDS2 data does not exist - using None!"
@@ -169,6 +170,7 @@ def main():
         # Load todays data
         tds = BILdata(tdsfile, 'uint16')
         tds.read()
+        tds.data = tds.data.copy() # updated in place by model()
 #        tds.data = float32(tds.data)
         
     # Setup outputs
@@ -188,8 +190,7 @@ def main():
     tds = model(tm.data, sd.data, tds.data)
         
     # Set no-data values to UintFillValue
-    mask = senorge_mask()
-    tds[mask] = UintFillValue    
+    land_mask().fill(tds, UintFillValue)    
     
     if options.bil:
         # Write to BIL file
@@ -199,7 +200,7 @@ def main():
         print biltext
     
     if options.nc:
-        from pysenorge.io.nc import NCdata
+        from pysenorge.io.nc import NCseries, season_filename
         # Prepare data
 #        nctds = int2float(tds)
 #        imask = mask == False
@@ -207,12 +208,10 @@ def main():
 #        nctds[imask] = nctds[imask]/10.0
         # Change array order 
         nctds = flipud(tds)
-        # Write to NC file
-        ncfile = NCdata(os.path.join(outdir, outfile+'.nc'))
-        ncfile.zip = True
-        ncfile.new(secs)
-        ncfile.add_variable(themedir, nctds.dtype.str, "days",
-                            themename, nctds)
+        # Add todays map to the season file
+        ncfile = NCseries(season_filename(outdir, themedir, cdt))
+        ncfile.open()
+        ncfile.put(secs, themedir, nctds.dtype.str, "days", themename, nctds)
         ncfile.close()
     
     if options.png:
@@ -29,12 +29,12 @@ from optparse import OptionParser
 execfile("set_pysenorge_path.py")
 
 # Additional
-from netCDF4 import Dataset
 from numpy import sqrt, mean
 
 # Own
 from pysenorge.set_environment import netCDFin, netCDFout
-from pysenorge.io.nc import NCdata
+from pysenorge.io.nc import NCdata, netcdf_path
+from pysenorge.io.forecast import forecast_source
 from pysenorge.tools.date_converters import iso2datetime, datetime2BILdate
 from pysenorge.converters import nan2fill
 from pysenorge.grid import interpolate
@@ -79,33 +79,28 @@ def main():
         parser.error("Please provide an input file!")
     else:
         # Add full path to the filename
-        ncfile = os.path.join(netCDFin, str(cdt.year), ncfilename)
+        ncfile = netcdf_path(os.path.join(netCDFin, str(cdt.year), ncfilename))
     
     timerange = eval(options.timerange)
     
     if not os.path.exists(ncfile):
         parser.error("%s does not exist!" % ncfile)
     else:
+        # Load wind data from prognosis (netCDF file) for the selected or
+        # full timerange
         if timerange == None:
-            # Load wind data from prognosis (netCDF file) for full timerange
-            ds = Dataset(ncfile, 'r')
-            wind_time = ds.variables['time'][:]
-            x_wind = ds.variables['x_wind'][:,:,:]
-            y_wind = ds.variables['y_wind'][:,:,:]
-            rlon = ds.variables['rlon'][:]
-            rlat = ds.variables['rlat'][:]
-            ds.close()    
-            print "xwind-shape", x_wind.shape
+            tndx = slice(None)
         else:
-            # Load wind data from prognosis (netCDF file) for selected timerange
-            ds = Dataset(ncfile, 'r')
-            wind_time = ds.variables['time'][timerange[0]:timerange[1]]
-            x_wind = ds.variables['x_wind'][timerange[0]:timerange[1],:,:]
-            y_wind = ds.variables['y_wind'][timerange[0]:timerange[1],:,:]
-            rlon = ds.variables['rlon'][:]
-            rlat = ds.variables['rlat'][:]
-            ds.close()    
-            print "xwind-shape", x_wind.shape
+            tndx = slice(timerange[0], timerange[1])
+        fc = forecast_source(ncfile)
+        # read only the part overlapping the seNorge grid
+        rows, cols = fc.crop_window()
+        wind_time = fc.times(tndx)
+        x_wind = fc.get('x_wind', tndx, rows, cols)
+        y_wind = fc.get('y_wind', tndx, rows, cols)
+        rlon = fc.axis('rlon')[cols]
+        rlat = fc.axis('rlat')[rows]
+        print "xwind-shape", x_wind.shape
 
     
     # Setup outputs
@@ -133,7 +128,7 @@ def main():
     total_wind_avg_intp = nan2fill(total_wind_avg_intp)
     
     # Write to NC file
-    ncfile = NCdata(os.path.join(outdir, outfile+'.nc'))
+    ncfile = NCdata(os.path.join(outdir, outfile+'.nc'), profile='web-map')
     ncfile.new(wind_time[0])
     
     ncfile.add_variable(themedir, total_wind_avg.dtype.str, "m s-1", themename, total_wind_avg_intp)
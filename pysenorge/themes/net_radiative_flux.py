@@ -16,14 +16,14 @@ Calculation of the net radiative flux:
 import os, time
 from optparse import OptionParser
 # Additional
-from netCDF4 import Dataset
 from numpy import flipud, add
 # Own
 from pysenorge.functions.energy_flux import EnergyNetFluxBalance
 from pysenorge.set_environment import netCDFin, BILout, FloatFillValue, \
                                       UintFillValue
 from pysenorge.io.bil import BILdata
-from pysenorge.io.nc import NCdata
+from pysenorge.io.nc import NCdata, netcdf_path
+from pysenorge.io.forecast import forecast_source
 from pysenorge.io.png import writePNG
 from pysenorge.tools.date_converters import iso2datetime, datetime2BILdate
 from pysenorge.converters import nan2fill
@@ -78,35 +78,29 @@ def main():
         parser.error("Please provide an input file!")
     else:
         # Add full path to the filename
-        ncfile = os.path.join(netCDFin, str(cdt.year), ncfilename)
+        ncfile = netcdf_path(os.path.join(netCDFin, str(cdt.year), ncfilename))
     
     timerange = eval(options.timerange)
     
     if not os.path.exists(ncfile):
         parser.error("%s does not exist!" % ncfile)
     else:
+        # Load flux data from prognosis (netCDF file) for the selected or
+        # entire time-range
         if timerange == None:
-            # Load wind data from prognosis (netCDF file) for entire time-range
-            ds = Dataset(ncfile, 'r')
-            _time = ds.variables['time'][:]
-            SWnet = ds.variables['net_sw_surface'][:,:,:]
-            LWnet = ds.variables['net_lw_surface'][:,:,:]
-            Hs = ds.variables['sensible_heat_surface'][:,:,:]
-            Hl = ds.variables['latent_heat_surface'][:,:,:]
-            rlon = ds.variables['rlon'][:]
-            rlat = ds.variables['rlat'][:]
-            ds.close()
+            tndx = slice(None)
         else:
-            # Load wind data from prognosis (netCDF file) for selected time-range
-            ds = Dataset(ncfile, 'r')
-            _time = ds.variables['time'][timerange[0]:timerange[1]]
-            SWnet = ds.variables['net_sw_surface'][timerange[0]:timerange[1],:,:]
-            LWnet = ds.variables['net_lw_surface'][timerange[0]:timerange[1],:,:]
-            Hs = ds.variables['sensible_heat_surface'][timerange[0]:timerange[1],:,:]
-            Hl = ds.variables['latent_heat_surface'][timerange[0]:timerange[1],:,:]
-            rlon = ds.variables['rlon'][:]
-            rlat = ds.variables['rlat'][:]
-            ds.close()
+            tndx = slice(timerange[0], timerange[1])
+        fc = forecast_source(ncfile)
+        # read only the part overlapping the seNorge grid
+        rows, cols = fc.crop_window()
+        _time = fc.times(tndx)
+        SWnet = fc.get('net_sw_surface', tndx, rows, cols)
+        LWnet = fc.get('net_lw_surface', tndx, rows, cols)
+        Hs = fc.get('sensible_heat_surface', tndx, rows, cols)
+        Hl = fc.get('latent_heat_surface', tndx, rows, cols)
+        rlon = fc.axis('rlon')[cols]
+        rlat = fc.axis('rlat')[rows]
     
     from netCDF4 import num2date
     for t in _time:
@@ -130,8 +124,8 @@ def main():
     # Calculate the wind speed vector - using model()
     Rnet = model(SWnet, LWnet, Hs, Hl)
     
-    # interpolate total average wind speed to seNorge grid
-    Rnet_intp = interpolate(rlon, rlat, Rnet)
+    # remap the net flux to the seNorge grid - area-weighted
+    Rnet_intp = interpolate(rlon, rlat, Rnet, method='conservative')
     
     # Replace NaN values with the appropriate FillValue
     Rnet_intp = nan2fill(Rnet_intp)
@@ -5,11 +5,13 @@ Doc...
 :Author: kmu
 :Created: 13. Sept. 2011
 '''
-import os
+import os, sys
+import imp
 import logging
 from datetime import timedelta, datetime
 execfile(os.path.join(os.path.dirname(__file__), "set_pysenorge_path.py"))
 from pysenorge.tools.date_converters import iso2datetime
+from pysenorge.io import cache
 
 
 def runPeriod(scriptname, start_date, end_date):
@@ -44,6 +46,55 @@ def runPeriod(scriptname, start_date, end_date):
     logging.info('Script finished: %s' % datetime.now().isoformat())
     
     
+def runPeriodInProcess(scriptnames, start_date, end_date, cachemb=512):
+    """
+    Runs several themes day by day within this process, so input layers
+    read by more than one theme - e.g. *tm* and *sd* by both depth hoar
+    indices - are read once and then served by the layer cache, see
+    *pysenorge.io.cache*.
+    
+    Example input:
+    scriptnames = ["depth_hoar_index_1.py", "depth_hoar_index_2.py"]
+    start_date = "2011-09-01"
+    end_date = "2011-10-24"
+    """
+    LOG_FILENAME = os.path.join(os.path.expanduser("~"), 'run_period.log')
+    logging.basicConfig(filename=LOG_FILENAME,level=logging.INFO)
+    
+    logging.info('Script started: %s' % datetime.now().isoformat())
+    
+    cache.enable(cachemb)
+    themes = []
+    for scriptname in scriptnames:
+        script = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                              scriptname)
+        themes.append((scriptname, imp.load_source(scriptname.split('.')[0],
+                                                   script)))
+    
+    start_date =  iso2datetime(start_date+"T00:00:00")
+    end_date =  iso2datetime(end_date+"T00:00:00")
+    
+    dt = timedelta(days=1)
+    cwd = os.getcwd()
+    argv = sys.argv
+    try:
+        while start_date <= end_date:
+            strdate = start_date.strftime("%Y-%m-%d")
+            for scriptname, theme in themes:
+                sys.argv = [scriptname, strdate]
+                try:
+                    theme.main()
+                except SystemExit:
+                    logging.info("%s failed for %s" % (scriptname, strdate))
+                os.chdir(cwd) # themes change directory when creating folders
+            start_date = start_date+dt
+    finally:
+        sys.argv = argv
+    
+    cache.layer_cache.report()
+    logging.info('Script finished: %s' % datetime.now().isoformat())
+    
+    
 if __name__ == "__main__":
 #    runPeriod("wind_10m_daily.py", "2011-01-26", "2011-04-30")
     runPeriod("wind_600m_daily.py", "2011-10-01", "2011-12-14")
@@ -51,4 +102,6 @@ if __name__ == "__main__":
 #    runPeriod("additional_snow_depth_wind600.py", "2011-11-01", "2011-12-14")
 #    runPeriod("depth_hoar_index_1.py", "2011-09-01", "2011-10-24")
 #    runPeriod("depth_hoar_index_2.py", "2010-09-01", "2011-10-20")
+#    runPeriodInProcess(["depth_hoar_index_1.py", "depth_hoar_index_2.py"],
+#                       "2011-09-01", "2011-10-24")
     
\ No newline at end of file
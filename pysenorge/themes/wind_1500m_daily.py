@@ -300,83 +300,71 @@ def main():
         mask = senorge_mask()
 
         #Avg wind
-        bil_avg_wind = flipud(uint16(total_wind_avg_intp * 10.0))
-        bil_avg_wind[mask] = UintFillValue
-
         bilfile = BILdata(os.path.join(outdir1,
                           outfile1 + '.bil'),
                           datatype='uint16')
-        #Colapse into one dimension
-        biltext = bilfile.write(bil_avg_wind.flatten())
+        biltext = bilfile.write(flipud(total_wind_avg_intp), scale=10.0, mask=mask)
         print biltext
 
         # Max wind
-        bil_max_wind = flipud(uint16(max_wind_intp * 10.0))
-        bil_max_wind[mask] = UintFillValue
         bilfile = BILdata(os.path.join(outdir2,
                           outfile2 + '.bil'),
                           datatype='uint16')
-        biltext = bilfile.write(bil_max_wind.flatten())
+        biltext = bilfile.write(flipud(max_wind_intp), scale=10.0, mask=mask)
         print biltext
 
         # bil wind at 00
-        bil_wind_00 = flipud(uint16(wind_00 * 10.0))
-        bil_wind_00[mask] = UintFillValue
         bilfile = BILdata(os.path.join(outdir_hour,
                           outfile3 + '.bil'),
                           datatype='uint16')
-        biltext = bilfile.write(bil_wind_00.flatten())
+        biltext = bilfile.write(flipud(wind_00), scale=10.0, mask=mask)
         print biltext
 
         # bil wind at 06
-        bil_wind_06 = flipud(uint16(wind_06 * 10.0))
-        bil_wind_06[mask] = UintFillValue
         bilfile = BILdata(os.path.join(outdir_hour,
                           outfile4 + '.bil'),
                           datatype='uint16')
-        biltext = bilfile.write(bil_wind_06.flatten())
+        biltext = bilfile.write(flipud(wind_06), scale=10.0, mask=mask)
         print biltext
 
         #bil wind at 12
-        bil_wind_12 = flipud(uint16(wind_12 * 10.0))
-        bil_wind_12[mask] = UintFillValue
         bilfile = BILdata(os.path.join(outdir_hour,
                           outfile5 + '.bil'),
                           datatype='uint16')
-        biltext = bilfile.write(bil_wind_12.flatten())
+        biltext = bilfile.write(flipud(wind_12), scale=10.0, mask=mask)
         print biltext
 
         #bil wind at 18
-        bil_wind_18 = flipud(uint16(wind_18 * 10.0))
-        bil_wind_18[mask] = UintFillValue
         bilfile = BILdata(os.path.join(outdir_hour,
                           outfile6 + '.bil'),
                           datatype='uint16')
-        biltext = bilfile.write(bil_wind_18.flatten())
+        biltext = bilfile.write(flipud(wind_18), scale=10.0, mask=mask)
         print biltext
 
 #---------------------------------------------------------
     #Option --nc: write a nc file
     if options.nc:
-        ncfile = NCdata(os.path.join(outdir1, outfile1 + '.nc'))
+        ncfile = NCdata(os.path.join(outdir1, outfile1 + '.nc'),
+                        profile='web-map')
 
         ncfile.new(wind_time[-1])
 
-        ncfile.add_variable('avg_wind_speed', total_wind_avg.dtype.str, "m s-1",
-                             'Average wind speed last 24h', total_wind_avg_intp)
-        ncfile.add_variable('max_wind_speed', max_wind.dtype.str, "m s-1",
-                             'Maximum wind gust last 24h', max_wind_intp)
-        ncfile.add_variable('wind_direction', wind_dir_cat.dtype.str,
-                             "cardinal direction",
-                             'Prevailing wind direction last 24h', wind_dir_intp)
-        ncfile.add_variable('wind_00', wind_00.dtype.str, "m s-1",
-                             'Wind forecast 01:00', wind_00)
-        ncfile.add_variable('wind_06', wind_06.dtype.str, "m s-1",
-                             'Wind forecast 07:00', wind_06)
-        ncfile.add_variable('wind_12', wind_12.dtype.str, "m s-1",
-                             'Wind forecast 13:00', wind_12)
-        ncfile.add_variable('wind_18', wind_18.dtype.str, "m s-1",
-                             'Wind forecast 19:00', wind_18)
+        ncfile.add_variables([
+            ('avg_wind_speed', total_wind_avg.dtype.str, "m s-1",
+             'Average wind speed last 24h', total_wind_avg_intp),
+            ('max_wind_speed', max_wind.dtype.str, "m s-1",
+             'Maximum wind gust last 24h', max_wind_intp),
+            ('wind_direction', wind_dir_cat.dtype.str, "cardinal direction",
+             'Prevailing wind direction last 24h', wind_dir_intp),
+            ('wind_00', wind_00.dtype.str, "m s-1",
+             'Wind forecast 01:00', wind_00),
+            ('wind_06', wind_06.dtype.str, "m s-1",
+             'Wind forecast 07:00', wind_06),
+            ('wind_12', wind_12.dtype.str, "m s-1",
+             'Wind forecast 13:00', wind_12),
+            ('wind_18', wind_18.dtype.str, "m s-1",
+             'Wind forecast 19:00', wind_18),
+            ])
 
         ncfile.close()
 
@@ -47,21 +47,14 @@ from optparse import OptionParser
 execfile(os.path.join(os.path.dirname(__file__), "set_pysenorge_path.py"))  
 
 # Additional
-try:
-    from netCDF4 import Dataset
-except ImportError:
-    try:
-        from Scientific.IO.NetCDF import NetCDFFile as Dataset
-    except ImportError:
-        print '''WARNING: Can not find module "netCDF4" or "Scientific.IO.NetCDF"!
-        Please install for netCDF file support.'''
 from numpy import sqrt, mean, flipud, zeros_like, zeros, uint16#, arctan2
 
 # Own
 from pysenorge.set_environment import netCDFin, BILout, \
                                       FloatFillValue, UintFillValue
 from pysenorge.io.bil import BILdata
-from pysenorge.io.nc import NCdata
+from pysenorge.io.nc import NCdata, netcdf_path
+from pysenorge.io.forecast import forecast_source
 from pysenorge.io.png import writePNG
 from pysenorge.tools.date_converters import iso2datetime, datetime2BILdate, get_hydroyear
 from pysenorge.converters import nan2fill
@@ -190,31 +183,27 @@ def main():
         parser.error("Please provide an input file!")
     else:
         # Add full path to the filename
-        ncfile = os.path.join(netCDFin, str(cdt.year), ncfilename)
+        ncfile = netcdf_path(os.path.join(netCDFin, str(cdt.year), ncfilename))
     
     timerange = eval(options.timerange)
     
     if not os.path.exists(ncfile):
         parser.error("%s does not exist!" % ncfile)
     else:
+        # Load wind data from prognosis (netCDF file) for the selected or
+        # entire time-range
         if timerange == None:
-            # Load wind data from prognosis (netCDF file) for entire time-range
-            ds = Dataset(ncfile, 'r')
-            wind_time = ds.variables['time'][:]
-            x_wind = ds.variables['x_wind_600m'][:,:,:]
-            y_wind = ds.variables['y_wind_600m'][:,:,:]
-            rlon = ds.variables['rlon'][:]
-            rlat = ds.variables['rlat'][:]
-            ds.close()
+            tndx = slice(None)
         else:
-            # Load wind data from prognosis (netCDF file) for selected time-range
-            ds = Dataset(ncfile, 'r')
-            wind_time = ds.variables['time'][timerange[0]:timerange[1]]
-            x_wind = ds.variables['x_wind_600m'][timerange[0]:timerange[1],:,:]
-            y_wind = ds.variables['y_wind_600m'][timerange[0]:timerange[1],:,:]
-            rlon = ds.variables['rlon'][:]
-            rlat = ds.variables['rlat'][:]
-            ds.close()
+            tndx = slice(timerange[0], timerange[1])
+        fc = forecast_source(ncfile)
+        # read only the part overlapping the seNorge grid
+        rows, cols = fc.crop_window()
+        wind_time = fc.times(tndx)
+        x_wind = fc.get('x_wind_600m', tndx, rows, cols)
+        y_wind = fc.get('y_wind_600m', tndx, rows, cols)
+        rlon = fc.axis('rlon')[cols]
+        rlat = fc.axis('rlat')[rows]
             
 #    from netCDF4 import num2date
 #    for t in wind_time:
@@ -278,22 +267,17 @@ def main():
         # Write to BIL file
         
         # avg wind
-        bil_avg_wind = flipud(uint16(total_wind_avg_intp*10.0))
-        bil_avg_wind[mask] = UintFillValue
-        
         bilfile = BILdata(os.path.join(outdir1,
                           outfile1+'.bil'),
                           datatype='uint16')
-        biltext = bilfile.write(bil_avg_wind.flatten()) # collapsed into one dimension
+        biltext = bilfile.write(flipud(total_wind_avg_intp), scale=10.0, mask=mask)
         print biltext
         
         #  max wind
-        bil_max_wind = flipud(uint16(max_wind_intp*10.0))
-        bil_max_wind[mask] = UintFillValue
         bilfile = BILdata(os.path.join(outdir2,
                           outfile2+'.bil'),
                           datatype='uint16')
-        biltext = bilfile.write(bil_max_wind.flatten())
+        biltext = bilfile.write(flipud(max_wind_intp), scale=10.0, mask=mask)
         print biltext
         
 #        # wind direction
@@ -308,14 +292,16 @@ def main():
     
     if options.nc:
         # Write to NC file
-        ncfile = NCdata(os.path.join(outdir1, outfile1+'.nc'))
+        ncfile = NCdata(os.path.join(outdir1, outfile1+'.nc'), profile='web-map')
 #        ncfile.rootgrp.info = themename
         ncfile.new(wind_time[-1])
         
-        ncfile.add_variable('avg_wind_speed', total_wind_avg.dtype.str, "m s-1",
-                            'Average wind speed last 24h', total_wind_avg_intp)
-        ncfile.add_variable('max_wind_speed', max_wind.dtype.str, "m s-1",
-                            'Maximum wind gust last 24h', max_wind_intp)
+        ncfile.add_variables([
+            ('avg_wind_speed', total_wind_avg.dtype.str, "m s-1",
+             'Average wind speed last 24h', total_wind_avg_intp),
+            ('max_wind_speed', max_wind.dtype.str, "m s-1",
+             'Maximum wind gust last 24h', max_wind_intp),
+            ])
 #        ncfile.add_variable('wind_direction', wind_dir.dtype.str,
 #                            "cardinal direction",
 #                            'Prevailing wind direction last 24h', wind_dir_intp)
@@ -19,11 +19,11 @@ from pysenorge.set_environment import timeunit
 from pysenorge.io.bil import BILdata
 from pysenorge.io.nc import NCdata
 from pysenorge.tools.date_converters import get_date_filename, iso2datetime
-from pysenorge.grid import senorge_mask
+from pysenorge.grid import land_mask
 from pysenorge.converters import get_FillValue
 
 def BIL2netCDF(BILfile, BILdtype='uint16', outdir=os.getcwd(), theme_name='undefined',
-               theme_unit='undefined', long_name='undefined'):
+               theme_unit='undefined', long_name='undefined', profile='archive'):
     '''
     Convenience function converting the given BIL file to netCDF.
     
@@ -32,6 +32,8 @@ def BIL2netCDF(BILfile, BILdtype='uint16', outdir=os.getcwd(), theme_name='undef
     @param theme_name: Short name for the theme.   
     @param theme_unit: Metric unit of the theme data.
     @param long_name: Descriptive name for the theme. 
+    @param profile: Output profile, see L{pysenorge.io.nc.nc_profiles} - the
+        converted files are kept long term by default.
     
     @return: netCDF file in the output directory.
     '''
@@ -41,11 +43,9 @@ def BIL2netCDF(BILfile, BILdtype='uint16', outdir=os.getcwd(), theme_name='undef
     yy, mm, dd = "13", "09", "11"
     tstring = yy+'-'+mm+'-'+dd+' 06:00:00'
     secs = date2num(iso2datetime(tstring), timeunit)
-    mask = flipud(senorge_mask())
     ncdata = flipud(int16(bd.data)) # array needs to be flipped ud-down and transposed to fit the coordinate system
-    ncdata[mask] = get_FillValue(ncdata.dtype)
-    ncfile = NCdata(os.path.join(outdir, ncfilename))
-#    ncfile.zip = True
+    land_mask().fill(ncdata, get_FillValue(ncdata.dtype), 'nc')
+    ncfile = NCdata(os.path.join(outdir, ncfilename), profile=profile)
     ncfile.new(secs)
     print ncdata.dtype.str
     ncfile.add_variable(theme_name, ncdata.dtype.str, theme_unit,
@@ -8,49 +8,175 @@ De/Compress files using the gzip library.
 import os
 import gzip
 import time
+import shutil
+import tempfile
+from multiprocessing import Pool
 
+# Size of the blocks streamed from one file to the other
+CHUNKSIZE = 2**20
 
-def gdecompress(filename, gzremove=False):
+
+def gdecompress(filename, gzremove=False, outdir=None, force=False):
     """
     Unzips the file I{filename}.
     
+    The data is streamed in blocks of L{CHUNKSIZE} bytes to a temporary file,
+    which replaces the target when complete. If the target exists and is not
+    older than I{filename} nothing is done.
+    
     @param filename: Gzipped file
     @param gzremove: Boolean, if I{True} the original zip file will be deleted. 
-    """
-    fileObj = gzip.GzipFile(filename, 'rb');
-    fileContent = fileObj.readlines();
-    fileObj.close()
+    @param outdir: Folder of the unzipped file - default: folder of I{filename}
+    @param force: Boolean, if I{True} an up to date target is overwritten.
     
+    @return: Name of the unzipped file
+    """
     newname = filename.replace('.gz','')
-    fileObjOut = file(newname, 'wb');
-    fileObjOut.writelines(fileContent)
-    fileObjOut.close()
-    
-    statinfo = os.stat(newname)
-    print "Unzipped file: %s" % os.path.abspath(filename)
-    print "Time of creation:", time.ctime(statinfo.st_ctime)
-    print "Time of last access:", time.ctime(statinfo.st_atime)
+    if outdir is not None:
+        newname = os.path.join(outdir, os.path.basename(newname))
+    if _stream(gzip.open(filename, 'rb'), filename, newname, force):
+        print "Unzipped file: %s" % os.path.abspath(filename)
     
     if gzremove:
-        os.system("rm %s" % filename)
+        os.remove(filename)
         
     return newname
     
     
-def gcompress(filename, outdir=os.getcwd()):
+def gcompress(filename, outdir=os.getcwd(), level=6, force=False):
     """
-    Gzips the file I{filename}.
+    Gzips the file I{filename}, streaming like L{gdecompress}.
     
     @param filename: The file(path) to be gzipped.
     @param outdir: Folder where the zipped file is stored - default=current.
+    @param level: Compression level 1 (fast) to 9 (small).
+    @param force: Boolean, if I{True} an up to date target is overwritten.
+    
+    @return: Name of the gzipped file
+    """
+    newname = os.path.join(outdir, os.path.basename(filename)+'.gz')
+    if _stream(open(filename, 'rb'), filename, newname, force, level):
+        print "Zipped file: %s" % os.path.abspath(filename)
+    return newname
+    
+    
+def _stream(fin, filename, newname, force, level=None):
+    """
+    Copies I{fin} to I{newname}, gzipped if I{level} is given.
+    
+    @return: I{False} if I{newname} was up to date.
+    """
+    if not force and os.path.exists(newname) and \
+            os.path.getmtime(newname) >= os.path.getmtime(filename):
+        fin.close()
+        print "Up to date: %s" % newname
+        return False
+    
+    t0 = time.time()
+    fd, tmpname = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(newname)))
+    try:
+        raw = os.fdopen(fd, 'wb')
+        fout = raw
+        if level is not None:
+            fout = gzip.GzipFile(os.path.basename(filename), 'wb', level, raw)
+        try:
+            shutil.copyfileobj(fin, fout, CHUNKSIZE)
+        finally:
+            fin.close()
+            fout.close()
+            raw.close()
+        os.chmod(tmpname, 0644)
+        # rename replaces an existing file atomically, except on Windows
+        if os.name == 'nt' and os.path.exists(newname):
+            os.remove(newname)
+        os.rename(tmpname, newname)
+    except:
+        if os.path.exists(tmpname):
+            os.remove(tmpname)
+        raise
+    
+    _report(filename, newname, time.time() - t0)
+    return True
+
+
+def _report(filename, newname, secs):
+    size = max(os.path.getsize(filename), os.path.getsize(newname))
+    print "%s: %.1f MB in %.1f s (%.1f MB/s)" % (os.path.basename(newname),
+        size / 2.0**20, secs, size / 2.0**20 / max(secs, 1e-6))
+
+
+def _job(args):
+    func, filename, kwargs = args
+    if func == 'gdecompress':
+        return gdecompress(filename, **kwargs)
+    else:
+        return gcompress(filename, **kwargs)
+
+
+def gdecompress_many(filenames, nprocs=4, **kwargs):
+    """
+    Unzips several files in parallel, see L{gdecompress} for the keywords.
+    
+    @param filenames: List of gzipped files
+    @param nprocs: Number of processes
+    
+    @return: List of the unzipped file names
+    """
+    return _run_many('gdecompress', filenames, nprocs, kwargs)
+
+
+def gcompress_many(filenames, nprocs=4, **kwargs):
+    """
+    Gzips several files in parallel, see L{gcompress} for the keywords.
+    
+    @param filenames: List of files
+    @param nprocs: Number of processes
+    
+    @return: List of the gzipped file names
+    """
+    return _run_many('gcompress', filenames, nprocs, kwargs)
+
+
+def _run_many(func, filenames, nprocs, kwargs):
+    t0 = time.time()
+    jobs = [(func, f, kwargs) for f in filenames]
+    if nprocs > 1 and len(jobs) > 1:
+        pool = Pool(nprocs)
+        try:
+            result = pool.map(_job, jobs, chunksize=1)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        result = map(_job, jobs)
+    secs = time.time() - t0
+    size = sum(os.path.getsize(f) for f in result if os.path.exists(f))
+    print "%i files, %.1f MB ready in %.1f s (%.1f MB/s)" % (len(result),
+        size / 2.0**20, secs, size / 2.0**20 / max(secs, 1e-6))
+    return result
+    
+    
+def bilcompress(filename, outdir, datatype='uint16', codec='zlib', blockrows=64):
+    """
+    Stores a BIL file as compressed BIL file (LAYOUT CBIL) with the same name
+    in I{outdir}. Unlike gzipped files these can be read directly by
+    L{BILdata}, and only the blocks covering the requested rows are
+    decompressed.
+    
+    @param filename: The BIL file to be compressed.
+    @param outdir: Folder where the compressed file is stored.
+    @param datatype: Data-type used if the file has no .hdr file.
+    @param codec: Name of the codec, see L{pysenorge.io.bil.register_codec}.
+    @param blockrows: Number of rows per compressed block.
     """
-    fileObj = open(filename, 'rb')
-    fileObjOut = gzip.open(os.path.join(outdir,
-                                        os.path.basename(filename)+'.gz'),
-                                        'wb')
-    fileObjOut.writelines(fileObj)
-    fileObjOut.close()
-    fileObj.close()
+    from pysenorge.io.bil import BILdata
+    bd = BILdata(filename, datatype)
+    bd.read(mmap=True)
+    cbd = BILdata(os.path.join(outdir, os.path.basename(filename)),
+                  bd.datatype, nbands=bd.nbands, bandnames=bd.bandnames,
+                  codec=codec, blockrows=blockrows)
+    cbd._set_dimension(bd.nrows, bd.ncols, bd.nbands)
+    return cbd.write(bd.data)
     
     
 if __name__ == "__main__":
@@ -9,10 +9,8 @@ Doc...
 # Built-in
 import os
 execfile("../themes/set_pysenorge_path.py") # Adds folder containing the "pysenorge" package to the PYTHONPATH @UnusedImport
-# Additional
-from netCDF4 import Dataset, num2date
 # Own
-from pysenorge.set_environment import timeunit
+from pysenorge.io.nc import NCreader
 from pysenorge.io.png import writePNG
 
 def netCDF2PNG(ncfile, parameter, timendx=0, CLTfile=None, outdir=None):
@@ -32,11 +30,12 @@ def netCDF2PNG(ncfile, parameter, timendx=0, CLTfile=None, outdir=None):
     if outdir==None:
         outdir = os.path.dirname(os.path.abspath(ncfile))
     
-    rootgrp = Dataset(ncfile, 'r')
-    dt = num2date(rootgrp.variables['time'][timendx], timeunit).isoformat()
+    nc = NCreader(ncfile)
+    dt = nc.dates()[timendx].isoformat()
     print dt
     dt = dt.split('T')[0].replace('-','_')
-    data = rootgrp.variables[parameter][timendx,:,:]
+    data = nc.read(parameter, timendx)
+    nc.close()
     
     # Write to PNG file
     writePNG(data, os.path.join(outdir, parameter+'_'+dt), CLTfile)
@@ -6,8 +6,9 @@ Script for unzipping the met.no UM4 prognosis from 00:00 every day.
 If a start and end date in ISO format is given as separate arguments.
 All files between those dates are extracted.
 
-*Note:* The name of the .gz files differs from the unzipped file name.\
-Use *gdecompress* to extract the zipped files!
+The files are extracted in parallel, files that are already extracted are
+skipped (see *gcompression.gdecompress_many*). Themes reading through
+*pysenorge.io.nc.NCreader* can also read the .gz files directly.
 
 :Author: kmu
 :Created: 09. feb. 2011
@@ -16,63 +17,45 @@ Use *gdecompress* to extract the zipped files!
 import sys
 import os
 import datetime
-import gzip
+# Own
+from gcompression import gdecompress_many
 
-# Define the decompression method
-def gdecompress(filename, gzremove=False):
-    """
-    Unzips the file I{filename}.
 
-    Parameters:
-    -----------
-    - filename: Gzipped file
-    - gzremove: Boolean, if I{True} the original zip file will be deleted. 
-    """
-    fileObj = gzip.GzipFile(filename, 'rb');
-    fileContent = fileObj.readlines();
-    fileObj.close()
-    
-    newname = filename.replace('.gz','')
-    fileObjOut = file(newname, 'wb');
-    fileObjOut.writelines(fileContent)
-    fileObjOut.close()
-    
-    print "Unzipped file: %s" % os.path.abspath(filename)
-    
-    if gzremove:
-        os.system("rm %s" % filename)
-        
-    return newname
-
-
-def todays(basedir):
+def todays(basedir, nprocs=2):
     cdate = datetime.date.today()
     workdir = os.path.join(basedir, str(cdate.year))
-    os.chdir(workdir)
     
     # Convert isodate to filename-date
     cdatestr = str(cdate).replace('-','_')
     
-    gdecompress("UM4_ml00_%s.nc.gz" % cdatestr)
-    gdecompress("UM4_sf00_%s.nc.gz" % cdatestr)
+    gdecompress_many([os.path.join(workdir, "UM4_ml00_%s.nc.gz" % cdatestr),
+                      os.path.join(workdir, "UM4_sf00_%s.nc.gz" % cdatestr)],
+                     nprocs)
     print "Finished: %s" % datetime.datetime.now().isoformat()
    
     
-def trange(period, basedir):
+def trange(period, basedir, nprocs=4):
     from date_converters import iso2datetime, datetime2BILdate
     gzremove=False
     startdate = iso2datetime(period[0]+" 06:00:00")
     enddate = iso2datetime(period[1]+" 06:00:00")
     dt = datetime.timedelta(days=1)
     cdate = startdate
-    workdir = os.path.join(basedir, str(cdate.year))
-    os.chdir(workdir)
+    filenames = []
     while cdate <= enddate:
         # Convert isodate to filename-date
         cdatestr = datetime2BILdate(cdate)
-        gdecompress("UM4_ml00_%s.nc.gz" % cdatestr, gzremove=gzremove)
-        gdecompress("UM4_sf00_%s.nc.gz" % cdatestr, gzremove=gzremove)
+        workdir = os.path.join(basedir, str(cdate.year))
+        for name in ("UM4_ml00_%s.nc.gz" % cdatestr,
+                     "UM4_sf00_%s.nc.gz" % cdatestr):
+            filename = os.path.join(workdir, name)
+            if os.path.exists(filename):
+                filenames.append(filename)
+            else:
+                print "Missing: %s" % filename
         cdate = cdate+dt
+    # Files already extracted are skipped
+    gdecompress_many(filenames, nprocs, gzremove=gzremove)
     print "Finished: %s" % datetime.datetime.now().isoformat()
         
 
@@ -32,6 +32,125 @@ class Test(unittest.TestCase):
         print bdo.data
         # Assert if data from bil file is equal to the inital array
         self.assertEqual(A.all, bdo.data.all, "Not equal")
+        
+        
+    def testPacked(self):
+        from numpy import arange
+        from pysenorge.grid import senorge_mask
+        # Values outside the mask are replaced by no-data when packed
+        A = arange(1550*1195, dtype=uint16).reshape((1550, 1195))
+        mask = senorge_mask()
+        A[mask] = 65535
+        
+        try:
+            bd = BILdata("tmp_packed.bil", "uint16", packed=True)
+            bd.write(A)
+            self.assertEqual(os.path.getsize("tmp_packed.bil"),
+                             2 * (~mask).sum(), "Not only land cells stored")
+            
+            bdo = BILdata("tmp_packed.bil", "uint16")
+            bdo.read()
+            self.assertTrue((A == bdo.data).all(), "Not equal")
+        finally:
+            for f in ("tmp_packed.bil", "tmp_packed.hdr"):
+                if os.path.exists(f):
+                    os.remove(f)
+
+
+    def testPackedThenPlain(self):
+        from numpy import arange
+        # A plain write must replace the header of a packed file
+        A = arange(1550*1195, dtype=uint16).reshape((1550, 1195))
+        BILdata("tmp_relayout.bil", "uint16", packed=True).write(A)
+        BILdata("tmp_relayout.bil", "uint16").write(A)
+        bdo = BILdata("tmp_relayout.bil", "uint16")
+        bdo.read()
+        self.assertEqual(bdo.layout, 'BIL')
+        self.assertTrue((A == bdo.data).all(), "Not equal")
+        os.remove("tmp_relayout.bil")
+        os.remove("tmp_relayout.hdr")
+
+
+
+    def testCompressedThenPlain(self):
+        from numpy import arange
+        # A plain write must replace the header of a compressed file
+        A = arange(1550*1195, dtype=uint16).reshape((1550, 1195))
+        BILdata("tmp_relayout.bil", "uint16", codec='zlib').write(A)
+        BILdata("tmp_relayout.bil", "uint16").write(A)
+        bdo = BILdata("tmp_relayout.bil", "uint16")
+        bdo.read()
+        self.assertEqual(bdo.layout, 'BIL')
+        self.assertTrue((A == bdo.data).all(), "Not equal")
+        os.remove("tmp_relayout.bil")
+        os.remove("tmp_relayout.hdr")
+
+    def testStridedWrite(self):
+        from numpy import flipud, zeros, float64, array_equal
+        from numpy.random import RandomState
+        # A flipped view is scaled and converted row band by row band
+        x = RandomState(4).rand(1550, 1195) * 100.
+        bd = BILdata("tmp_strided.bil", "uint16")
+        bd.write(flipud(x), scale=10.0, chunkrows=100)
+        bdo = BILdata("tmp_strided.bil", "uint16")
+        bdo.read()
+        self.assertTrue(array_equal(bdo.data, uint16(flipud(x)*10.0)),
+                        "Not equal")
+        
+        # A failing write leaves the existing file untouched
+        bad_mask = zeros((10, 10), bool)
+        self.assertRaises(IndexError, BILdata("tmp_strided.bil", "uint16").write,
+                          float64(x), scale=10.0, mask=bad_mask)
+        bdo = BILdata("tmp_strided.bil", "uint16")
+        bdo.read()
+        self.assertTrue(array_equal(bdo.data, uint16(flipud(x)*10.0)),
+                        "Existing file changed")
+        self.assertEqual([f for f in os.listdir('.')
+                          if f.startswith("tmp_strided.bil") and
+                          f.endswith(".tmp")], [], "Temporary file left")
+        os.remove("tmp_strided.bil")
+
+
+    def testStack(self):
+        import tempfile, shutil
+        from datetime import datetime, timedelta
+        from pysenorge.io.bil import BILStack
+        from pysenorge.tools.date_converters import get_hydroyear, \
+                                                    datetime2BILdate
+        basedir = tempfile.mkdtemp()
+        try:
+            # five days across the start of a hydrological year, one missing
+            start = datetime(2011, 8, 30)
+            for n in range(5):
+                cdate = start + timedelta(days=n)
+                if n == 2:
+                    continue
+                outdir = os.path.join(basedir, 'sd', str(get_hydroyear(cdate)))
+                if not os.path.exists(outdir):
+                    os.makedirs(outdir)
+                BILdata(os.path.join(outdir, "sd_%s.bil" %
+                                     datetime2BILdate(cdate)),
+                        "uint16").write(ones((1550, 1195), uint16) * n)
+            
+            for nthreads in (1, 3):
+                stack = BILStack('sd', start, start + timedelta(days=4),
+                                 basedir=basedir, nthreads=nthreads)
+                cube = stack.read()
+                self.assertEqual(cube.shape, (5, 1550, 1195))
+                self.assertEqual(cube.dtype, uint16)
+                self.assertTrue(cube is stack.data)
+                self.assertEqual(stack.missing, [start + timedelta(days=2)])
+                self.assertTrue((cube[2] == 65535).all(), "Missing day not no-data")
+                for n in (0, 1, 3, 4):
+                    self.assertTrue((cube[n] == n).all(), "Day %i not equal" % n)
+            
+            # a truncated file is reported
+            fid = open(stack.filenames[4], 'r+b')
+            fid.truncate(1000)
+            fid.close()
+            self.assertRaises(IOError, stack.read)
+        finally:
+            shutil.rmtree(basedir)
 
 
 if __name__ == "__main__":
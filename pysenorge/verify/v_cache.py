@@ -0,0 +1,82 @@
+'''
+Tests the layer cache in pysenorge.io.cache and its use by BILdata.
+
+@author: kmu
+@since: 18. okt. 2026
+'''
+import unittest, sys, os
+sys.path.insert(0,os.path.abspath('../..'))
+
+from numpy import zeros, ones, uint8, uint16, array_equal
+from pysenorge.io import cache
+from pysenorge.io.cache import LayerCache
+from pysenorge.io.bil import BILdata
+
+class Test(unittest.TestCase):
+
+    def tearDown(self):
+        cache.disable()
+        for f in ("tmp_cache.bil", "tmp_cache.hdr"):
+            if os.path.exists(f):
+                os.remove(f)
+
+
+    def testLRU(self):
+        lc = LayerCache(maxbytes=300)
+        a, b, c = zeros(100, uint8), zeros(100, uint8), zeros(100, uint8)
+        self.assertTrue(lc.put('a', a) is a)
+        self.assertFalse(a.flags.writeable)
+        lc.put('b', b)
+        lc.put('c', c)
+        self.assertTrue(lc.get('a') is a) # 'a' is the most recent now
+        lc.put('d', zeros(100, uint8))
+        self.assertTrue(lc.get('b') is None)
+        self.assertTrue(lc.get('a') is a)
+        self.assertTrue(lc.get('c') is c)
+        stats = lc.stats()
+        self.assertEqual((stats['hits'], stats['misses'], stats['evictions']),
+                         (3, 1, 1))
+        self.assertEqual((stats['items'], stats['nbytes']), (3, 300))
+        # arrays larger than the cache are not kept
+        big = zeros(400, uint8)
+        lc.put('big', big)
+        self.assertTrue(big.flags.writeable)
+        self.assertTrue(lc.get('big') is None)
+        # a disabled cache holds nothing
+        self.assertFalse(LayerCache().enabled())
+
+
+    def testBILdata(self):
+        A = ones((1550, 1195), uint16)
+        BILdata("tmp_cache.bil", "uint16").write(A)
+        cache.enable(64)
+        
+        first = BILdata("tmp_cache.bil", "uint16")
+        first.read()
+        second = BILdata("tmp_cache.bil", "uint16")
+        second.read()
+        # a hit returns the shared, read-only array
+        self.assertTrue(second.data is first.data)
+        self.assertFalse(second.data.flags.writeable)
+        self.assertEqual(cache.layer_cache.stats()['hits'], 1)
+        
+        # mapped and packed-only reads bypass the cache
+        mm = BILdata("tmp_cache.bil", "uint16")
+        mm.read(mmap=True)
+        self.assertFalse(mm.data is first.data)
+        BILdata("tmp_cache.bil", "uint16").read(expand=False)
+        stats = cache.layer_cache.stats()
+        self.assertEqual((stats['hits'], stats['misses'], stats['items']),
+                         (1, 1, 1))
+        
+        # rewriting the file invalidates the cached array
+        BILdata("tmp_cache.bil", "uint16").write(A * 2)
+        third = BILdata("tmp_cache.bil", "uint16")
+        third.read()
+        self.assertFalse(third.data is first.data)
+        self.assertTrue(array_equal(third.data, A * 2))
+        self.assertEqual(cache.layer_cache.stats()['hits'], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,94 @@
+'''
+Tests the Catalog class.
+
+@author: kmu
+@since: 18. okt. 2026
+'''
+import unittest, sys, os
+import tempfile, shutil
+sys.path.insert(0,os.path.abspath('../..'))
+
+from datetime import datetime
+from numpy import ones, uint16
+from netCDF4 import Dataset
+from pysenorge.io.bil import BILdata
+from pysenorge.io.catalog import Catalog
+
+class Test(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.themedir = os.path.join(self.tmpdir, 'sd', '2011')
+        os.makedirs(self.themedir)
+        os.makedirs(os.path.join(self.tmpdir, 'empty'))
+        for day in (1, 2, 3):
+            self._write_bil(day)
+        ds = Dataset(os.path.join(self.themedir, 'sd_2011_02_04.nc'), 'w')
+        ds.createDimension('time', None)
+        ds.createDimension('x', 3)
+        ds.createVariable('time', 'f8', ('time',))[:] = [86400., 0.]
+        ds.createVariable('sd', 'f4', ('time', 'x'))
+        ds.close()
+        self.cat = Catalog(os.path.join(self.tmpdir, 'catalog.sqlite'))
+
+
+    def tearDown(self):
+        self.cat.close()
+        shutil.rmtree(self.tmpdir)
+
+
+    def _write_bil(self, day, nrows=2):
+        bd = BILdata(os.path.join(self.themedir, 'sd_2011_02_%02i.bil' % day),
+                     'uint16')
+        bd.nrows, bd.ncols = nrows, 3
+        bd.write(ones((nrows, 3), uint16), hdr=True)
+
+
+    def testScan(self):
+        self.assertEqual(self.cat.scan(self.tmpdir, 'theme', '*.bil', 2),
+                         (3, 0))
+        self.assertEqual(self.cat.scan(self.tmpdir, 'theme', '*.nc', 1),
+                         (1, 0))
+        # nothing changed
+        self.assertEqual(self.cat.scan(self.tmpdir, 'theme', '*.bil', 2),
+                         (0, 0))
+        # a changed file is inspected again
+        self._write_bil(2, nrows=4)
+        self.assertEqual(self.cat.scan(self.tmpdir, 'theme', '*.bil', 1),
+                         (1, 0))
+        self.assertEqual(self.cat.find(theme='sd', start='2011-02-02',
+                                       end='2011-02-02')[0]['shape'], '4,3')
+        
+        # removals are limited to the scanned pattern and directory
+        os.remove(os.path.join(self.themedir, 'sd_2011_02_04.nc'))
+        os.remove(os.path.join(self.themedir, 'sd_2011_02_03.bil'))
+        self.assertEqual(self.cat.scan(os.path.join(self.tmpdir, 'empty'),
+                                       'theme', '*', 1), (0, 0))
+        self.assertEqual(self.cat.scan(self.tmpdir, 'theme', '*.bil', 1),
+                         (0, 1))
+        self.assertEqual(len(self.cat.find('theme', 'sd')), 3)
+        self.assertEqual(self.cat.scan(self.tmpdir, 'theme', '*.nc', 1),
+                         (0, 1))
+        self.assertEqual([f['date'] for f in self.cat.find('theme', 'sd')],
+                         ['2011-02-01', '2011-02-02'])
+
+
+    def testFindLatest(self):
+        self.cat.scan(self.tmpdir, 'theme', '*.bil', 1)
+        self.cat.scan(self.tmpdir, 'theme', '*.nc', 1)
+        entries = self.cat.find('theme', 'sd', datetime(2011, 2, 2))
+        self.assertEqual([f['date'] for f in entries],
+                         ['2011-02-02', '2011-02-03', '2011-02-04'])
+        latest = self.cat.latest('theme', 'sd')
+        self.assertEqual(latest['date'], '2011-02-04')
+        self.assertEqual(latest['format'], 'nc')
+        self.assertEqual((latest['ntimes'], latest['tstart'], latest['tend']),
+                         (2, 0., 86400.))
+        self.assertEqual(latest['variables'], 'sd')
+        self.assertEqual(self.cat.find('theme', 'sd', end='2011-02-01')[0]
+                         ['variables'], 'sd')
+        self.assertTrue(self.cat.latest('forecast') is None)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,57 @@
+'''
+Tests the ForecastSource class.
+
+@author: kmu
+@since: 18. okt. 2026
+'''
+import unittest, sys, os
+import tempfile, shutil
+sys.path.insert(0,os.path.abspath('../..'))
+
+from numpy import arange, isnan, float32, int16
+from netCDF4 import Dataset
+from pysenorge.io.forecast import ForecastSource
+from pysenorge.io.cache import LayerCache
+
+class Test(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.ncfile = os.path.join(self.tmpdir, "packed.nc")
+        ds = Dataset(self.ncfile, 'w')
+        ds.createDimension('time', 2)
+        ds.createDimension('rlat', 3)
+        ds.createDimension('rlon', 4)
+        ds.createVariable('time', 'f8', ('time',))[:] = [0., 3600.]
+        # packed variable: stored as int16, unpacked with scale_factor
+        var = ds.createVariable('net_sw_surface', 'i2', ('time', 'rlat', 'rlon'),
+                                fill_value=int16(-32767))
+        var.scale_factor = 0.01
+        var.add_offset = 0.
+        data = arange(24, dtype=float32).reshape((2, 3, 4))
+        var[:] = data
+        var[0, 1, 2] = -32767 * 0.01 # masked by netCDF4 as fill value
+        ds.close()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def testPackedFill(self):
+        fc = ForecastSource(self.ncfile, LayerCache(0))
+        data = fc.get('net_sw_surface')
+        fc.close()
+        self.assertEqual(data.dtype, float32)
+        self.assertTrue(isnan(data[0, 1, 2]), "Fill value not set to NaN")
+        self.assertEqual(isnan(data).sum(), 1)
+        self.assertAlmostEqual(data[1, 2, 3], 23., 4)
+
+    def testWindow(self):
+        fc = ForecastSource(self.ncfile, LayerCache(0))
+        data = fc.get('net_sw_surface', 1, slice(1, 3), slice(0, 2))
+        fc.close()
+        self.assertEqual(data.shape, (2, 2))
+        self.assertAlmostEqual(data[0, 0], 16., 4)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,202 @@
+'''
+Tests the grid geometry, regridding and grid decomposition in
+L{pysenorge.grid}.
+
+@author: kmu
+@since: 18. okt. 2026
+'''
+import unittest, sys, os
+sys.path.insert(0,os.path.abspath('../..'))
+
+from numpy import arange, ones, isnan, allclose, nan, memmap, meshgrid, \
+                  searchsorted, reshape, array_equal
+from numpy.random import RandomState
+from pysenorge import grid
+from pysenorge.grid import Regridder, ConservativeRegridder, interp, \
+                           map_tiles
+
+def _baseline_coordinates(xin, yin, xout, yout):
+    # the element-wise irregular-grid branch interp was shipped with
+    xoutflat = xout.flatten(); youtflat = yout.flatten()
+    ix = (searchsorted(xin,xoutflat)-1).tolist()
+    iy = (searchsorted(yin,youtflat)-1).tolist()
+    xoutflat = xoutflat.tolist(); xin = xin.tolist()
+    youtflat = youtflat.tolist(); yin = yin.tolist()
+    xcoords = []; ycoords = []
+    for n,i in enumerate(ix):
+        if i < 0:
+            xcoords.append(-1) # outside of range on xin (lower end)
+        elif i >= len(xin)-1:
+            xcoords.append(len(xin)) # outside range on upper end.
+        else:
+            xcoords.append(float(i)+(xoutflat[n]-xin[i])/(xin[i+1]-xin[i]))
+    for m,j in enumerate(iy):
+        if j < 0:
+            ycoords.append(-1) # outside of range of yin (on lower end)
+        elif j >= len(yin)-1:
+            ycoords.append(len(yin)) # outside range on upper end
+        else:
+            ycoords.append(float(j)+(youtflat[m]-yin[j])/(yin[j+1]-yin[j]))
+    xcoords = reshape(xcoords,xout.shape)
+    ycoords = reshape(ycoords,yout.shape)
+    return xcoords, ycoords
+
+
+def _box_mean(stack):
+    # tile function of testMapTiles: 3x3 mean of the daily maximum, using
+    # the halo, and the sum over time
+    from numpy import pad
+    A = pad(stack.max(axis=0), 1, 'edge')
+    ny, nx = A.shape[0]-2, A.shape[1]-2
+    mean = sum(A[r:r+ny, c:c+nx] for r in range(3) for c in range(3)) / 9.
+    return mean, stack.sum(axis=0)
+
+
+class Test(unittest.TestCase):
+
+    def setUp(self):
+        self.rs = RandomState(42)
+        # 2.5 km source cells covering the 1 km target cells exactly
+        self.xin = arange(1250., 50000., 2500.)
+        self.yin = arange(1250., 40000., 2500.)
+        self.xout = arange(500., 50000., 1000.)
+        self.yout = arange(500., 40000., 1000.)
+
+
+    def testConservation(self):
+        rg = ConservativeRegridder(self.xin, self.yin, self.xout, self.yout,
+                                   cachedir=False)
+        z = self.rs.rand(3, len(self.yin), len(self.xin))
+        out = rg(z)
+        self.assertEqual(out.shape, (3, len(self.yout), len(self.xout)))
+        # area integrals of source and target agree
+        for t in range(3):
+            self.assertAlmostEqual(out[t].sum() * 1000.**2 / 1.e6,
+                                   z[t].sum() * 2500.**2 / 1.e6, 6)
+        # a constant field stays constant
+        self.assertTrue(allclose(rg(ones(z.shape[1:])), 1.))
+
+
+    def testMissingAndOutside(self):
+        rg = ConservativeRegridder(self.xin[:10], self.yin, self.xout,
+                                   self.yout, cachedir=False)
+        z = ones((len(self.yin), 10))
+        z[0, 0] = nan
+        out = rg(z)
+        # target cells beyond the source grid are NaN
+        self.assertTrue(isnan(out[:, 25:]).all())
+        # NaN source cells are left out of the mean, cells covered by them
+        # alone are NaN
+        self.assertTrue(isnan(out[:2, :2]).all())
+        out[:2, :2] = 1.
+        self.assertTrue(allclose(out[:, :25], 1.))
+
+
+    def testGeometry(self):
+        xgrid, ygrid, lon, lat = grid.senorge_geometry()
+        # persisted under the checksum of the grid definition
+        checksum = grid.grid_checksum()
+        self.assertEqual(checksum, grid.grid_checksum())
+        fname = grid._geometry_file('lon', checksum)
+        self.assertTrue(checksum[:12] in os.path.basename(fname))
+        self.assertTrue(os.path.exists(fname))
+        # a new process memory-maps the saved arrays
+        grid._geometry.clear()
+        xgrid2, ygrid2, lon2, lat2 = grid.senorge_geometry()
+        for a in (lon2, lat2):
+            self.assertTrue(isinstance(a, memmap))
+            self.assertFalse(a.flags.writeable)
+        self.assertTrue(allclose(lon2, lon) and allclose(lat2, lat))
+        # served from the module-level cache afterwards
+        self.assertTrue(grid.senorge_geometry()[2] is lon2)
+        # and equal to the inverse UTM transform
+        from pyproj import Proj
+        p = Proj(grid.senorge_proj4)
+        for r, c in ((0, 0), (775, 600), (1549, 1194)):
+            plon, plat = p(xgrid2[r, c], ygrid2[r, c], inverse=True)
+            self.assertAlmostEqual(lon2[r, c], plon, 9)
+            self.assertAlmostEqual(lat2[r, c], plat, 9)
+
+
+    def testRegridder(self):
+        rs = self.rs
+        # regular and irregular source axes, target points partly outside
+        xirr = (self.xin + rs.uniform(-500., 500., len(self.xin)))
+        xout, yout = meshgrid(arange(-3000., 53000., 700.),
+                              arange(-2000., 42000., 900.))
+        z = rs.rand(2, len(self.yin), len(self.xin))
+        for xin in (self.xin, xirr):
+            for order in (0, 1):
+                rg = Regridder(xin, self.yin, xout, yout, order,
+                               cachedir=False)
+                out = rg(z)
+                for t in range(2):
+                    ref = interp(z[t], xin, self.yin, xout, yout,
+                                 order=order)
+                    self.assertTrue(allclose(out[t], ref))
+                # without scipy the index and weight arrays are applied
+                rg.matrix = None
+                self.assertTrue(allclose(rg(z[1]), out[1]))
+        
+        # missing data propagates as in interp, also from neighbours with
+        # zero weight: target points on the source nodes
+        xout, yout = meshgrid(self.xin, self.yin)
+        z = rs.rand(len(self.yin), len(self.xin))
+        z[3, 4] = nan
+        ref = interp(z, self.xin, self.yin, xout, yout)
+        self.assertEqual(isnan(ref).sum(), 4)
+        rg = Regridder(self.xin, self.yin, xout, yout, cachedir=False)
+        self.assertTrue(allclose(rg(z), ref, equal_nan=True))
+        rg.matrix = None
+        self.assertTrue(allclose(rg(z), ref, equal_nan=True))
+
+
+    def testIrregularInterp(self):
+        rs = self.rs
+        xin = self.xin + rs.uniform(-500., 500., len(self.xin))
+        yin = self.yin + rs.uniform(-500., 500., len(self.yin))
+        xout, yout = meshgrid(arange(-3000., 53000., 700.),
+                              arange(-2000., 42000., 900.))
+        # include points on the source nodes and on both ends
+        xout[0, :len(xin)] = xin
+        yout[:len(yin), 0] = yin
+        xc, yc = grid.grid_coordinates(xin, yin, xout, yout)
+        xb, yb = _baseline_coordinates(xin, yin, xout, yout)
+        self.assertEqual(xc.shape, xout.shape)
+        self.assertTrue(allclose(xc, xb, rtol=0., atol=1.e-9))
+        self.assertTrue(allclose(yc, yb, rtol=0., atol=1.e-9))
+        
+        # interp gives the same result as with the baseline coordinates
+        z = rs.rand(len(yin), len(xin))
+        for order in (0, 1, 3):
+            new = interp(z, xin, yin, xout, yout, order=order)
+            grid_coordinates = grid.grid_coordinates
+            grid.grid_coordinates = _baseline_coordinates
+            try:
+                old = interp(z, xin, yin, xout, yout, order=order)
+            finally:
+                grid.grid_coordinates = grid_coordinates
+            self.assertTrue(allclose(new, old, rtol=0., atol=1.e-9))
+        masked = interp(z, xin, yin, xout, yout, masked=True)
+        self.assertTrue(array_equal(masked.mask,
+                                    (xb < 0) | (xb > len(xin)-1) |
+                                    (yb < 0) | (yb > len(yin)-1)))
+
+
+    def testMapTiles(self):
+        stack = self.rs.rand(4, 155, 120)
+        mean, total = _box_mean(stack)
+        for kwargs in ({'nrows': 16},
+                       {'nrows': 16, 'ncols': 50, 'nworkers': 3},
+                       {'nrows': 16, 'ncols': 50, 'nworkers': 3,
+                        'processes': True}):
+            tmean, ttotal = map_tiles(_box_mean, (stack,), halo=1, **kwargs)
+            self.assertTrue(array_equal(tmean, mean), kwargs)
+            self.assertTrue(array_equal(ttotal, total), kwargs)
+        # without the halo the tile edges differ
+        tmean, ttotal = map_tiles(_box_mean, (stack,), nrows=16)
+        self.assertFalse(allclose(tmean, mean))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,80 @@
+'''
+Tests the layer codecs in pysenorge.io.layers.
+
+@author: kmu
+@since: 18. okt. 2026
+'''
+import unittest, sys, os
+sys.path.insert(0,os.path.abspath('../..'))
+
+from numpy import array, zeros, flipud, isnan, float32, uint16, int16, nan, \
+                  array_equal, allclose, where
+from pysenorge.io.layers import LayerCodec, layer_codecs, decode, encode
+
+class Test(unittest.TestCase):
+
+    def setUp(self):
+        # 7 rows, converted in blocks of 3 rows
+        self.values = array([[0.04, 0.05, 0.06],
+                             [-1.0, 0.0, 6553.4],
+                             [6553.5, 1.e9, nan],
+                             [1.25, 2.349, 3.351],
+                             [nan, nan, 10.0],
+                             [0.15, 0.25, 0.35],
+                             [100.0, 200.0, 300.0]])
+
+
+    def testEncode(self):
+        codec = LayerCodec('uint16', 0.1, 0.0, 'm s-1')
+        raw = codec.encode(self.values, chunkrows=3)
+        self.assertEqual(raw.dtype, uint16)
+        self.assertEqual(codec.fill, 65535)
+        # rounded to the nearest step, not truncated
+        self.assertEqual(list(raw[0]), [0, 0, 1])
+        self.assertEqual(list(raw[3]), [12, 23, 34])
+        # clipped to the range below the fill value
+        self.assertEqual(list(raw[1]), [0, 0, 65534])
+        self.assertEqual(list(raw[2]), [65534, 65534, 65535])
+        # NaN becomes the fill value, also in the last block
+        self.assertEqual(list(raw[4]), [65535, 65535, 100])
+        self.assertEqual(list(raw[6]), [1000, 2000, 3000])
+        # same result with a single block and for a strided view
+        self.assertTrue(array_equal(codec.encode(self.values), raw))
+        self.assertTrue(array_equal(codec.encode(flipud(self.values),
+                                                 chunkrows=3), flipud(raw)))
+
+
+    def testRoundTrip(self):
+        codec = layer_codecs['tm']
+        raw = encode(self.values, 'tm')
+        values = decode(raw, 'tm')
+        self.assertEqual(values.dtype, float32)
+        # fill value and NaN correspond
+        self.assertTrue(array_equal(isnan(values), raw == codec.fill))
+        self.assertTrue(array_equal(isnan(values), isnan(self.values)))
+        # within half a step where the value is in range
+        v = where(isnan(self.values), 1.e9, self.values)
+        inrange = (v > -273.1) & (v < 6000.)
+        self.assertTrue(allclose(values[inrange], self.values[inrange],
+                                 rtol=0., atol=0.05 + 1.e-4))
+        # decoding into a given array in blocks
+        out = zeros(raw.shape, float32)
+        codec.decode(raw, out, chunkrows=3)
+        self.assertTrue(allclose(out, values, equal_nan=True))
+
+
+    def testSigned(self):
+        codec = layer_codecs['depth_hoar_index_1']
+        raw = codec.encode(array([[-40000., -2.5, 2.5], [nan, 1.e6, -0.4]]),
+                           chunkrows=1)
+        self.assertEqual(raw.dtype, int16)
+        # rint rounds halves to even, the fill value 32767 stays unused
+        self.assertEqual(list(raw[0]), [-32768, -2, 2])
+        self.assertEqual(list(raw[1]), [32767, 32766, 0])
+        values = codec.decode(raw)
+        self.assertTrue(isnan(values[1, 0]))
+        self.assertEqual(values[0, 0], -32768.)
+
+
+if __name__ == "__main__":
+    unittest.main()